@@ -0,0 +1,347 @@
+"""
+Benchmark headless de las fichas estatales.
+
+Ejecuta la app con el AppTest de Streamlit (sin navegador ni servidor) para cada estado de
+STATE_MAP y mide, por sección numerada de la ficha, el tiempo de ejecución, el pico de memoria
+y los bytes del payload que se enviarían al navegador. El resultado se guarda en JSON para
+comparar builds antes de publicar.
+
+Cada sección va desde su st.header hasta el siguiente; lo que corre antes del primer encabezado
+(carga de datos, sidebar, botón del PDF) se reporta como "Encabezado". El pico de memoria se mide
+en una segunda pasada con tracemalloc para no inflar los tiempos de la primera. Ambas pasadas son
+en frío para el estado: la ficha corre sin precalentamiento ni prefetch, y antes de la pasada de
+memoria se vacía st.cache_resource, así que su "Encabezado" incluye también la carga de datos y
+las matrices nacionales (después se repite el render sin medir para volver a cargarlas).
+
+El payload se desglosa por sección y tipo de elemento (markdown, plotly_chart, dataframe, image,
+otros) y se agrega entre estados, junto con la lista de los elementos más pesados (el <style>
+global, el botón del PDF en base64, tarjetas HTML, figuras). Las imágenes viajan aparte por HTTP:
+sus bytes se reportan como "image_media".
+
+Uso (desde la raíz del repositorio):
+    python benchmark.py
+    python benchmark.py --apps ficha_v2.py --estados "Querétaro,Tlaxcala" --salida bench.json
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.testing.v1 import AppTest
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+APPS_DEFAULT = ["ficha_v2.py", "ficha.py"]
+SECCION_INICIAL = "Encabezado"
+
+# Nombre canónico de cada sección y los textos de st.header que le corresponden
+# (ficha.py usa otra numeración y llama "Calificación Crediticia" a finanzas públicas).
+SECCIONES = [
+    ("Resumen Ejecutivo", ["Resumen Ejecutivo"]),
+    ("Estructura Económica", ["Estructura Económica"]),
+    ("Exportaciones", ["Exportación"]),
+    ("IED", ["Inversión Extranjera"]),
+    ("Remesas", ["Remesas"]),
+    ("Finanzas Públicas", ["Finanzas Públicas", "Calificación Crediticia"]),
+    ("Demografía", ["Demografía"]),
+    ("Productividad", ["Productividad"]),
+    ("Educación", ["Educación"]),
+    ("Competitividad", ["Competitividad"]),
+    ("Estados Similares", ["Estados Similares"]),
+]
+
+# Tipos de elemento que se reportan por separado; widgets y contenedores van a "otros"
+TIPOS_PAYLOAD = {
+    'markdown': 'markdown', 'plotly_chart': 'plotly_chart', 'dataframe': 'dataframe',
+    'arrow_data_frame': 'dataframe', 'image': 'image', 'imgs': 'image'
+}
+TOP_ELEMENTOS = 15
+
+def nombre_seccion(texto_header):
+    for nombre, claves in SECCIONES:
+        if any(c in str(texto_header) for c in claves):
+            return nombre
+    return str(texto_header)
+
+def leer_state_map(ruta_app):
+    # STATE_MAP se lee del código fuente (sin importar la app, que es un script de Streamlit)
+    arbol = ast.parse(open(ruta_app, encoding='utf-8').read())
+    for nodo in arbol.body:
+        if isinstance(nodo, ast.Assign) and any(getattr(t, 'id', None) == 'STATE_MAP' for t in nodo.targets):
+            return ast.literal_eval(nodo.value)
+    raise ValueError(f"No se encontró STATE_MAP en {ruta_app}")
+
+class MarcadorSecciones:
+    """Envuelve st.header mientras corre el script para partir la ejecución en tramos por sección."""
+
+    def __init__(self):
+        self.original = st.header
+        self.carga_media_original = MemoryMediaFileStorage.load_and_get_id
+        self.tramos = []
+        self.medir_memoria = False
+        self.media = {}
+
+    def __enter__(self):
+        marcador = self
+        def header_instrumentado(body, *args, **kwargs):
+            marcador.abrir(nombre_seccion(body))
+            return marcador.original(body, *args, **kwargs)
+        def carga_media_instrumentada(storage, path_or_data, *args, **kwargs):
+            # Tamaño de cada archivo multimedia (imágenes) por id, para sumarlo a su elemento
+            file_id = marcador.carga_media_original(storage, path_or_data, *args, **kwargs)
+            tam = os.path.getsize(path_or_data) if isinstance(path_or_data, str) else len(path_or_data)
+            marcador.media[file_id] = tam
+            return file_id
+        st.header = header_instrumentado
+        MemoryMediaFileStorage.load_and_get_id = carga_media_instrumentada
+        return self
+
+    def __exit__(self, *exc):
+        st.header = self.original
+        MemoryMediaFileStorage.load_and_get_id = self.carga_media_original
+
+    def iniciar(self, medir_memoria):
+        self.tramos = []
+        self.medir_memoria = medir_memoria
+        self.abrir(SECCION_INICIAL)
+
+    def abrir(self, nombre):
+        self.cerrar()
+        base = tracemalloc.get_traced_memory()[0] if self.medir_memoria else 0
+        if self.medir_memoria: tracemalloc.reset_peak()
+        self.tramos.append({'seccion': nombre, 'inicio': time.perf_counter(), 'memoria_base': base})
+
+    def cerrar(self):
+        if not self.tramos or 'tiempo_s' in self.tramos[-1]: return
+        tramo = self.tramos[-1]
+        tramo['tiempo_s'] = time.perf_counter() - tramo['inicio']
+        if self.medir_memoria:
+            tramo['memoria_pico_kb'] = max(tracemalloc.get_traced_memory()[1] - tramo['memoria_base'], 0) / 1024
+
+    def resultados(self):
+        # Una sección puede aparecer partida (p. ej. un header dentro de un if); se suman sus tramos
+        res = {}
+        for t in self.tramos:
+            r = res.setdefault(t['seccion'], {'tiempo_s': 0.0, 'memoria_pico_kb': 0.0})
+            r['tiempo_s'] += t.get('tiempo_s', 0.0)
+            r['memoria_pico_kb'] = max(r['memoria_pico_kb'], t.get('memoria_pico_kb', 0.0))
+        return res
+
+def payload_por_seccion(at, media):
+    # Tamaño serializado (protobuf) de cada elemento del árbol, asignado a la sección en curso
+    # y a su tipo. Devuelve {sección: {tipo: bytes}} y la lista de elementos individuales.
+    totales = {}
+    elementos = []
+    actual = SECCION_INICIAL
+
+    def sumar(seccion, tipo, n):
+        por_tipo = totales.setdefault(seccion, {})
+        por_tipo[tipo] = por_tipo.get(tipo, 0) + n
+
+    def recorrer(nodo, forzar=None):
+        nonlocal actual
+        for hijo in nodo.children.values():
+            tipo_st = getattr(hijo, 'type', None)
+            if forzar is None and tipo_st == 'header':
+                actual = nombre_seccion(hijo.value)
+            destino = forzar or actual
+            tipo = TIPOS_PAYLOAD.get(tipo_st, 'otros')
+            proto = getattr(hijo, 'proto', None)
+            if proto is not None:
+                n = proto.ByteSize()
+                sumar(destino, tipo, n)
+                if tipo == 'image':
+                    ids = [os.path.splitext(os.path.basename(img.url))[0] for img in getattr(proto, 'imgs', [])]
+                    n_media = sum(media.get(i, 0) for i in ids)
+                    if n_media: sumar(destino, 'image_media', n_media)
+                resumen = str(getattr(hijo, 'value', '') or '') if tipo == 'markdown' else tipo_st
+                elementos.append({'seccion': destino, 'tipo': tipo, 'bytes': n, 'resumen': " ".join(str(resumen).split())[:90]})
+            if getattr(hijo, 'children', None):
+                recorrer(hijo, forzar)
+
+    recorrer(at.main)
+    recorrer(at.sidebar, forzar="Sidebar")
+    return totales, elementos
+
+def benchmark_app(app, estados, medir_memoria=True, timeout=300):
+    ruta = os.path.join(RAIZ, app)
+    print(f"\n🚀 {app}: {len(estados)} estados")
+    at = AppTest.from_file(ruta, default_timeout=timeout)
+
+    with MarcadorSecciones() as marcador:
+        # Arranque en frío: carga de datos y matrices precalculadas del estado por defecto
+        t0 = time.perf_counter()
+        at.run()
+        arranque_s = time.perf_counter() - t0
+
+        filas = []
+        for idx, estado in enumerate(estados, 1):
+            at.session_state['estado_seleccionado'] = estado
+
+            marcador.iniciar(medir_memoria=False)
+            marcador.media = {}
+            t0 = time.perf_counter()
+            at.run()
+            total_s = time.perf_counter() - t0
+            marcador.cerrar()
+            tiempos = marcador.resultados()
+            payload_tipos, elementos = payload_por_seccion(at, marcador.media)
+            # Bytes enviados por el websocket (sin los archivos multimedia, que van por HTTP)
+            payload = {sec: sum(v for t, v in tipos.items() if t != 'image_media') for sec, tipos in payload_tipos.items()}
+            excepciones = [str(e.value)[:300] for e in at.exception]
+
+            memoria = {}
+            if medir_memoria:
+                # Sin vaciar la caché se mediría el render con el cálculo del estado ya guardado
+                st.cache_resource.clear()
+                tracemalloc.start()
+                marcador.iniciar(medir_memoria=True)
+                at.run()
+                marcador.cerrar()
+                memoria = marcador.resultados()
+                tracemalloc.stop()
+                # Vuelve a dejar cargados datos y matrices para que la pasada de tiempos del
+                # siguiente estado solo pague el cálculo de su estado, como la primera
+                at.run()
+
+            secciones = []
+            for nombre in dict.fromkeys(list(tiempos) + list(payload)):
+                secciones.append({
+                    'seccion': nombre,
+                    # El sidebar no es un tramo del script (se dibuja intercalado): solo reporta bytes
+                    'tiempo_s': round(tiempos[nombre]['tiempo_s'], 4) if nombre in tiempos else None,
+                    'memoria_pico_kb': round(memoria[nombre]['memoria_pico_kb'], 1) if nombre in memoria else None,
+                    'bytes': payload.get(nombre, 0),
+                    'bytes_por_tipo': payload_tipos.get(nombre, {})
+                })
+            filas.append({
+                'estado': estado,
+                'tiempo_total_s': round(total_s, 4),
+                'bytes_total': sum(payload.values()),
+                'bytes_media': sum(t.get('image_media', 0) for t in payload_tipos.values()),
+                'excepciones': excepciones,
+                'secciones': secciones,
+                'elementos_mayores': sorted(elementos, key=lambda e: -e['bytes'])[:TOP_ELEMENTOS]
+            })
+            aviso = f" ⚠️ {len(excepciones)} excepción(es)" if excepciones else ""
+            print(f"   [{idx}/{len(estados)}] {estado}: {total_s:.2f}s, {sum(payload.values()) / 1024:,.0f} KB{aviso}")
+
+    return {
+        'arranque_s': round(arranque_s, 4),
+        'estados': filas,
+        'resumen_secciones': resumir(filas),
+        'resumen_payload': resumir_payload(filas),
+        'elementos_mayores': elementos_mayores(filas)
+    }
+
+def resumir(filas):
+    df = pd.DataFrame([dict(s, estado=f['estado']) for f in filas for s in f['secciones']])
+    if df.empty: return []
+    orden = list(dict.fromkeys(df['seccion']))
+    res = []
+    for nombre in orden:
+        d = df[df['seccion'] == nombre]
+        t = pd.to_numeric(d['tiempo_s'], errors='coerce').dropna()
+        m = pd.to_numeric(d['memoria_pico_kb'], errors='coerce').dropna()
+        res.append({
+            'seccion': nombre,
+            'estados': int(d['estado'].nunique()),
+            'tiempo_mediana_s': round(float(t.median()), 4) if not t.empty else None,
+            'tiempo_p95_s': round(float(t.quantile(0.95)), 4) if not t.empty else None,
+            'tiempo_max_s': round(float(t.max()), 4) if not t.empty else None,
+            'memoria_pico_max_kb': round(float(m.max()), 1) if not m.empty else None,
+            'bytes_mediana': int(d['bytes'].median()),
+            'bytes_max': int(d['bytes'].max())
+        })
+    return res
+
+def resumir_payload(filas):
+    # Bytes por sección y tipo de elemento, agregados entre estados
+    df = pd.DataFrame([
+        {'estado': f['estado'], 'seccion': s['seccion'], 'tipo': tipo, 'bytes': n}
+        for f in filas for s in f['secciones'] for tipo, n in s.get('bytes_por_tipo', {}).items()
+    ])
+    if df.empty: return []
+    agg = df.groupby(['seccion', 'tipo'], sort=False)['bytes'].agg(['median', 'max', 'sum', 'count']).reset_index()
+    return [{
+        'seccion': r['seccion'], 'tipo': r['tipo'], 'estados': int(r['count']),
+        'bytes_mediana': int(r['median']), 'bytes_max': int(r['max']), 'bytes_total': int(r['sum'])
+    } for _, r in agg.iterrows()]
+
+def elementos_mayores(filas):
+    # Elementos individuales más pesados; un mismo elemento en varios estados se cuenta una vez
+    df = pd.DataFrame([dict(e, estado=f['estado']) for f in filas for e in f.get('elementos_mayores', [])])
+    if df.empty: return []
+    agg = df.groupby(['seccion', 'tipo', 'resumen'], sort=False).agg(bytes_max=('bytes', 'max'), estados=('estado', 'nunique')).reset_index()
+    return agg.sort_values('bytes_max', ascending=False).head(TOP_ELEMENTOS).to_dict('records')
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def imprimir_resumen(app, res):
+    print(f"\n📊 {app} (arranque en frío: {res['arranque_s']:.2f}s)")
+    tabla = pd.DataFrame(res['resumen_secciones'])
+    if tabla.empty: return
+    tiempos = [f['tiempo_total_s'] for f in res['estados']]
+    print(tabla.to_string(index=False))
+    print(f"   Total por estado: mediana {statistics.median(tiempos):.2f}s | máx {max(tiempos):.2f}s")
+
+    payload = pd.DataFrame(res['resumen_payload'])
+    if not payload.empty:
+        print(f"\n📦 Payload por sección y tipo (KB, mediana entre estados)")
+        pivote = payload.pivot_table(index='seccion', columns='tipo', values='bytes_mediana', aggfunc='sum', sort=False).fillna(0) / 1024
+        pivote['total (sin media)'] = pivote.drop(columns='image_media', errors='ignore').sum(axis=1)
+        print(pivote.round(1).to_string())
+        bytes_tot = [f['bytes_total'] for f in res['estados']]
+        print(f"   Total por rerun: mediana {statistics.median(bytes_tot) / 1024:,.0f} KB | máx {max(bytes_tot) / 1024:,.0f} KB")
+        print(f"\n🔎 Elementos más pesados")
+        print(pd.DataFrame(res['elementos_mayores']).to_string(index=False, max_colwidth=60))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark headless por sección de las fichas estatales.")
+    parser.add_argument("--apps", default=",".join(APPS_DEFAULT), help="Scripts a medir, separados por coma")
+    parser.add_argument("--estados", default="", help="Subconjunto de estados separados por coma (por defecto, todo STATE_MAP)")
+    parser.add_argument("--salida", default=None, help="Ruta del reporte JSON (por defecto benchmarks/benchmark_<fecha>.json)")
+    parser.add_argument("--sin-memoria", action="store_true", help="Omite la pasada con tracemalloc")
+    parser.add_argument("--timeout", type=int, default=300, help="Tiempo máximo por ejecución del script (s)")
+    args = parser.parse_args()
+    # Los tiempos por estado se miden en frío: sin el hilo de precalentamiento de la ficha ni el
+    # prefetch, que en el orden de STATE_MAP dejaría calculado el siguiente estado
+    os.environ.setdefault("FICHA_PRECALENTAR", "0")
+    os.environ.setdefault("FICHA_PREFETCH", "0")
+
+    # Las apps leen data/ y logos/ con rutas relativas a la raíz del repositorio
+    os.chdir(RAIZ)
+    reporte = {
+        'generado': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit_actual(),
+        'python': platform.python_version(),
+        'streamlit': st.__version__,
+        'pandas': pd.__version__,
+        'apps': {}
+    }
+    for app in [a.strip() for a in args.apps.split(",") if a.strip()]:
+        state_map = leer_state_map(os.path.join(RAIZ, app))
+        estados = [e.strip() for e in args.estados.split(",") if e.strip()] or list(state_map.values())
+        reporte['apps'][app] = benchmark_app(app, estados, medir_memoria=not args.sin_memoria, timeout=args.timeout)
+        imprimir_resumen(app, reporte['apps'][app])
+
+    salida = args.salida or os.path.join("benchmarks", f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    if os.path.dirname(salida): os.makedirs(os.path.dirname(salida), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Reporte guardado en: {salida}")
+
+if __name__ == "__main__":
+    main()
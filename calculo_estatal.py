@@ -0,0 +1,288 @@
+"""
+Cálculo por estado de la ficha estatal, sin dependencias de Streamlit.
+
+Reúne las partes de la ficha que recorren tablas completas para un solo estado: series IMSS
+(parseo de fechas, escala del eje y cruces de hitos), campos de formación de educación superior,
+fortalezas y áreas de oportunidad IMCO, y el Top 10 de sectores exportadores. El resultado de
+calcular_estado() es un diccionario de objetos serializables (pickle), de modo que puede
+calcularse en el mismo proceso o en un proceso trabajador.
+
+Uso desde la app:
+    import calculo_estatal as calc
+    calc.calcular_estado(estado, estado_id, tablas, catalogos)    # en el mismo proceso
+    pool = calc.crear_pool(workers, tablas, catalogos)
+    pool.submit(calc.calcular_estado, estado, estado_id)            # en un trabajador
+
+`tablas` son las tablas de TABLAS_CALCULO tal como las entrega load_data(); `catalogos` es un
+diccionario con normalizador, ignorados, correccion y tipos (los catálogos de la ficha).
+"""
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+TABLAS_CALCULO = ['export', 'imss_pue', 'imss_sal', 'edu_tot', 'edu_mat', 'edu_egr', 'imco_d']
+
+MESES = {'enero':1, 'febrero':2, 'marzo':3, 'abril':4, 'mayo':5, 'junio':6, 'julio':7, 'agosto':8, 'septiembre':9, 'octubre':10, 'noviembre':11, 'diciembre':12}
+NIVELES_EDU = ['Licenciatura', 'Técnico Superior', 'Maestría', 'Doctorado']
+PASOS_PUESTOS = [i * 10000 for i in range(1, 51)] + [i * 100000 for i in range(6, 51)]
+LINEAS_DEFAULT = 6
+MINIMO_EXPORTACION = 500
+
+# Estado del proceso trabajador: las tablas llegan una sola vez, al iniciar el pool
+_TRABAJADOR = {}
+_ARRANQUE = threading.Lock()
+
+def iniciar_worker(tablas, catalogos):
+    _TRABAJADOR['tablas'] = tablas
+    _TRABAJADOR['catalogos'] = catalogos
+
+def crear_pool(workers, tablas, catalogos):
+    """Pool de `workers` procesos "spawn" (no heredan los hilos del servidor), ya arrancados.
+
+    El pool nunca lanza procesos después de crearse: si un trabajador muere, queda roto
+    (BrokenProcessPool) y hay que crear otro. Lanza BrokenProcessPool si no arrancan todos.
+    """
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+        initializer=iniciar_worker, initargs=(tablas, catalogos)
+    )
+    # Streamlit ejecuta la ficha como __main__ y "spawn" reimporta __main__ en cada proceso
+    # nuevo, lo que volvería a correr la app completa. Todos los trabajadores se lanzan aquí,
+    # de una vez, con este módulo haciendo de __main__ mientras arrancan. ProcessPoolExecutor
+    # lanza un proceso por tarea enviada mientras no haya uno libre; los trabajadores tardan en
+    # importar pandas, así que las `workers` tareas deben lanzar los `workers` procesos, y se
+    # comprueba: uno lanzado más tarde, fuera del cambio de __main__, correría la app.
+    with _ARRANQUE:
+        principal = sys.modules['__main__']
+        sys.modules['__main__'] = sys.modules[__name__]
+        try:
+            arranques = [pool.submit(os.getpid) for _ in range(workers)]
+            lanzados = len(pool._processes)
+        finally:
+            sys.modules['__main__'] = principal
+    if lanzados != workers:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise BrokenProcessPool(f"Arrancaron {lanzados} de {workers} trabajadores")
+    for f in arranques: f.result()
+    return pool
+
+def a_numero(serie):
+    if pd.api.types.is_numeric_dtype(serie): return serie
+    return pd.to_numeric(serie.astype(str).str.replace(',', '').str.replace(' ', '').str.replace('$', '', regex=False), errors='coerce')
+
+def normalizar_entidades(serie, normalizador):
+    # Equivalente vectorizado de NAME_NORMALIZER.get(str(x).strip().title(), ...) fila por fila
+    return serie.astype(str).str.strip().str.title().replace(normalizador)
+
+def columna_estado(df, estado, normalizador):
+    return next((c for c in df.columns if normalizador.get(c, c) == estado), None)
+
+def variaciones(valores):
+    val_curr = valores.iloc[-1]
+    val_prev_m = valores.iloc[-2] if len(valores) > 1 else val_curr
+    val_prev_y = valores.iloc[-13] if len(valores) > 12 else val_curr
+    var_m = (val_curr - val_prev_m) / val_prev_m * 100 if val_prev_m else 0
+    var_y = (val_curr - val_prev_y) / val_prev_y * 100 if val_prev_y else 0
+    return val_curr, var_m, var_y
+
+def cruces_hitos(df, col, hitos, col_mes):
+    # Primer mes en que la serie alcanza cada línea guía que empieza por encima del inicio
+    cruces = []
+    for hito in hitos:
+        if df[col].iloc[0] < hito:
+            cruce = df[df[col] >= hito]
+            if not cruce.empty:
+                r = cruce.iloc[0]
+                cruces.append((r['Date'], r[col], f"{r[col_mes][:3].capitalize()} {r['Año']}"))
+    return cruces
+
+# ==========================================
+# EMPLEO FORMAL (IMSS)
+# ==========================================
+def serie_salario(df_sal, estado, normalizador):
+    col = columna_estado(df_sal, estado, normalizador)
+    if not col: return None
+    df = df_sal[['Fecha', col]].copy()
+    df[col] = a_numero(df[col])
+    df[['Mes_Str', 'Año']] = df['Fecha'].astype(str).str.split(' ', expand=True)
+    df['Mes_Num'] = df['Mes_Str'].str.lower().str.strip().map(MESES)
+    df['Date'] = pd.to_datetime(df['Año'] + '-' + df['Mes_Num'].astype(str).str.zfill(2) + '-01')
+    df = df[df['Date'].dt.year >= 2000].sort_values('Date').reset_index(drop=True)
+    if df.empty: return None
+
+    min_sal, max_sal = df[col].min(), df[col].max()
+    y_min = (min_sal // 100) * 100
+    y_max = ((max_sal // 100) + 1) * 100
+    hitos = list(range(int(y_min), int(y_max) + 1, 100))
+    val_curr, var_m, var_y = variaciones(df[col])
+    df['Hover_Text'] = df['Mes_Str'].str.capitalize() + ' ' + df['Año'].astype(str)
+    return {
+        'col': col, 'serie': df[['Date', col, 'Hover_Text']], 'rango': (y_min, y_max), 'hitos': hitos,
+        'cruces': cruces_hitos(df, col, hitos, 'Mes_Str'), 'valor': val_curr, 'var_m': var_m, 'var_y': var_y,
+        'fecha': str(df['Fecha'].iloc[-1]).title()
+    }
+
+def serie_puestos(df_pue, estado, normalizador, num_lineas_target):
+    col = columna_estado(df_pue, estado, normalizador)
+    if not col: return None
+    df = df_pue[['Mes', 'Año', col]].copy()
+    df[col] = a_numero(df[col])
+    df['Mes'] = df['Mes'].astype(str)
+    df['Mes_Num'] = df['Mes'].str.lower().str.strip().map(MESES)
+    df['Date'] = pd.to_datetime(df['Año'].astype(str) + '-' + df['Mes_Num'].astype(str).str.zfill(2) + '-01')
+    df = df[df['Año'] >= 2000].sort_values('Date').reset_index(drop=True)
+    if df.empty: return None
+
+    min_pue, max_pue = df[col].min(), df[col].max()
+    # Paso de las líneas guía: el que deja un número de líneas más parecido al de salarios
+    best_step, best_diff = PASOS_PUESTOS[0], float('inf')
+    for paso in PASOS_PUESTOS:
+        lineas = int((((max_pue // paso) + 1) * paso - (min_pue // paso) * paso) / paso) + 1
+        diff = abs(lineas - num_lineas_target)
+        if diff < best_diff: best_diff, best_step = diff, paso
+    y_min = (min_pue // best_step) * best_step
+    y_max = ((max_pue // best_step) + 1) * best_step
+    hitos = list(range(int(y_min), int(y_max) + 1, best_step))
+    val_curr, var_m, var_y = variaciones(df[col])
+    df['Hover_Text'] = df['Mes'].str.capitalize() + ' ' + df['Año'].astype(str)
+    return {
+        'col': col, 'serie': df[['Date', col, 'Hover_Text']], 'rango': (y_min, y_max), 'hitos': hitos,
+        'cruces': cruces_hitos(df, col, hitos, 'Mes'), 'valor': val_curr, 'var_m': var_m, 'var_y': var_y,
+        'fecha': f"{df['Mes'].iloc[-1].capitalize()} {df['Año'].iloc[-1]}"
+    }
+
+def calcular_imss(tablas, estado, normalizador):
+    # Salarios primero: su número de líneas guía fija la escala de la gráfica de puestos
+    salario = serie_salario(tablas['imss_sal'], estado, normalizador)
+    lineas = len(salario['hitos']) if salario else LINEAS_DEFAULT
+    return {'puestos': serie_puestos(tablas['imss_pue'], estado, normalizador, lineas), 'salario': salario}
+
+# ==========================================
+# EDUCACIÓN SUPERIOR
+# ==========================================
+def limpiar_columnas(df, cols):
+    for col in cols:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype(str).str.replace(',', '').astype(float)
+    return df
+
+def contexto_campo(df_full, val_col, estado, nivel, campo):
+    # Valor, posición, Top 1 y participación nacional de un campo de formación en un nivel
+    df_f = df_full[(df_full['Nivel_Agrupado'] == nivel) & (df_full['CAMPO AMPLIO'] == campo)]
+    agg = df_f.groupby('ENTIDAD_NORM', observed=True)[val_col].sum().reset_index()
+    tot_nac = agg[val_col].sum()
+    if tot_nac == 0 or agg.empty: return 0, 0, "-", 0
+    agg['Rank'] = agg[val_col].rank(ascending=False, method='min')
+    agg = agg.sort_values('Rank')
+    top1 = agg.iloc[0]['ENTIDAD_NORM']
+    st_row = agg[agg['ENTIDAD_NORM'].str.upper() == estado.upper()]
+    if st_row.empty: return 0, 0, top1, 0
+    return st_row.iloc[0][val_col], int(st_row.iloc[0]['Rank']), top1, (st_row.iloc[0][val_col] / tot_nac) * 100
+
+def campos_por_nivel(df, estado, val_col, share_col):
+    # Principal campo de formación del estado en cada nivel, con su contexto nacional
+    tarjetas = []
+    df_est = df[df['ENTIDAD_NORM'].str.upper() == estado.upper()]
+    for nivel in NIVELES_EDU:
+        subset = df_est[df_est['Nivel_Agrupado'] == nivel]
+        if subset.empty: continue
+        row = subset.sort_values(val_col, ascending=False).iloc[0]
+        campo = row['CAMPO AMPLIO']
+        if campo: tarjetas.append((nivel, campo, row[val_col], row[share_col], contexto_campo(df, val_col, estado, nivel, campo)))
+    return tarjetas
+
+def calcular_educacion(tablas, estado, normalizador):
+    try:
+        df_tot = tablas['edu_tot']
+        if not (normalizar_entidades(df_tot['ENTIDAD'], normalizador).str.upper() == estado.upper()).any():
+            return {'hay_estado': False}
+        df_mat = limpiar_columnas(tablas['edu_mat'].copy(), ['Matrícula Total', 'Participacion_Matricula'])
+        df_egr = limpiar_columnas(tablas['edu_egr'].copy(), ['Egresados Total', 'Participacion_Egresados'])
+        df_mat['ENTIDAD_NORM'] = normalizar_entidades(df_mat['ENTIDAD'], normalizador)
+        df_egr['ENTIDAD_NORM'] = normalizar_entidades(df_egr['ENTIDAD'], normalizador)
+        return {
+            'hay_estado': True,
+            'matricula': campos_por_nivel(df_mat, estado, 'Matrícula Total', 'Participacion_Matricula'),
+            'egresados': campos_por_nivel(df_egr, estado, 'Egresados Total', 'Participacion_Egresados')
+        }
+    except Exception as e:
+        # La sección muestra el error sin detener la ficha, como antes de separar el cálculo
+        return {'error': str(e)}
+
+# ==========================================
+# COMPETITIVIDAD (IMCO)
+# ==========================================
+def calcular_imco(tablas, estado, catalogos):
+    df_d = tablas['imco_d']
+    st_d = df_d[df_d['Entidad'].astype(str).str.strip().replace(catalogos['normalizador']) == estado]
+    if st_d.empty: return None
+    st_d = st_d[~st_d['Indicador'].isin(catalogos['ignorados'])]
+    indicador = st_d['Indicador'].astype(str).replace(catalogos['correccion'])
+    # Indicadores inversos (menor es mejor): se invierte la posición y el sentido del cambio
+    inverso = (indicador.str.strip().map(catalogos['tipos']).fillna("Directo") != "Directo").to_numpy()
+    rank = st_d['Rank'].to_numpy(dtype='float64')
+    cambio = st_d['Cambio_Posicion'].to_numpy(dtype='float64')
+    res = pd.DataFrame({
+        'Rank': rank, 'Indicador': indicador.to_numpy(),
+        'Puntaje_Fortaleza': np.where(inverso, 33 - rank, rank),
+        'Cambio_Ajustado': np.where(inverso, -cambio, cambio)
+    })
+    filas = lambda df: list(zip(df['Rank'].astype(int), df['Indicador'], df['Cambio_Ajustado']))
+    return {
+        'fortalezas': filas(res.sort_values('Puntaje_Fortaleza').head(5)),
+        'oportunidades': filas(res.sort_values('Puntaje_Fortaleza', ascending=False).head(5))
+    }
+
+# ==========================================
+# EXPORTACIONES
+# ==========================================
+def calcular_exportaciones(tablas, estado_id):
+    df_e = tablas['export']
+    max_y = df_e['Year'].max()
+    quarters_avail = df_e[df_e['Year'] == max_y]['Quarter'].unique()
+    del_estado = df_e[df_e['Estado_ID'] == estado_id]
+    es_total = del_estado['Sector'] == 'Total'
+    en_curr = del_estado['Year'] == max_y
+    en_prev = (del_estado['Year'] == (max_y - 1)) & del_estado['Quarter'].isin(quarters_avail)
+
+    res = {'max_y': max_y, 'trimestres': len(quarters_avail), 'top10': None}
+    st_e_curr = del_estado[en_curr & ~es_total]
+    if st_e_curr.empty: return res
+    top_all = st_e_curr.groupby('Sector', observed=True)['Valor'].sum().reset_index().sort_values('Valor', ascending=False)
+    top10 = top_all[top_all['Valor'] >= MINIMO_EXPORTACION].head(10)
+    if top10.empty: return res
+
+    tot_curr = top10['Valor'].sum()
+    top10['Part'] = (top10['Valor']/tot_curr*100) if tot_curr > 0 else 0
+    st_e_prev = del_estado[en_prev & ~es_total]
+    if not st_e_prev.empty:
+        prev_agg = st_e_prev.groupby('Sector', observed=True)['Valor'].sum().reset_index().rename(columns={'Valor': 'Valor_Prev'})
+        top10 = top10.merge(prev_agg, on='Sector', how='left')
+    else: top10['Valor_Prev'] = 0
+    top10['Valor_Prev'] = top10['Valor_Prev'].fillna(0)
+    top10['Sector'] = top10['Sector'].astype(str)
+
+    res.update(
+        top10=top10.reset_index(drop=True),
+        total_curr=del_estado[en_curr & es_total]['Valor'].sum(),
+        total_prev=del_estado[en_prev & es_total]['Valor'].sum()
+    )
+    return res
+
+def calcular_estado(estado, estado_id, tablas=None, catalogos=None):
+    """Resultados de un estado para todas las secciones; sin tablas usa las del trabajador."""
+    tablas = tablas if tablas is not None else _TRABAJADOR['tablas']
+    catalogos = catalogos if catalogos is not None else _TRABAJADOR['catalogos']
+    normalizador = catalogos['normalizador']
+    return {
+        'exportaciones': calcular_exportaciones(tablas, estado_id),
+        'imss': calcular_imss(tablas, estado, normalizador),
+        'educacion': calcular_educacion(tablas, estado, normalizador),
+        'imco': calcular_imco(tablas, estado, catalogos)
+    }
@@ -0,0 +1,181 @@
+"""
+Instrumentación ligera de la ficha estatal.
+
+Mide cuánto tarda cada sección y cada función auxiliar de una ejecución (rerun) de la app,
+cuántas llamadas a funciones cacheadas fueron hit o miss y cuántas filas recorrió cada una.
+Está apagada por defecto y en ese caso cada punto instrumentado cuesta una consulta a un
+atributo thread-local. Se activa con la variable de entorno FICHA_DIAGNOSTICO=1 o con el
+parámetro ?diagnostico=1 en la URL; entonces la app muestra un panel de diagnóstico al final
+y agrega una línea JSON por ejecución a logs/trazas_ficha.jsonl (configurable con
+FICHA_DIAGNOSTICO_RUTA).
+
+Uso en la app:
+    import diagnostico as diag
+    diag.iniciar(activo=...)                 # al inicio de cada ejecución
+    diag.seccion("1. Resumen Ejecutivo")     # marca el inicio de cada sección
+    with diag.span("pdf_zip"): ...           # tramo arbitrario
+    @diag.instrumentar("get_pib_metrics")    # función auxiliar
+    @diag.instrumentar("load_data", cache=True) + diag.marcar_calculo() dentro del cuerpo cacheado
+    diag.filas(len(df))                      # filas recorridas por el tramo en curso
+    diag.finalizar()                         # antes de st.stop() o al final del script
+"""
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+ACTIVO_ENV = os.environ.get("FICHA_DIAGNOSTICO", "").strip().lower() in ("1", "true", "si", "sí")
+RUTA_TRAZAS = os.environ.get("FICHA_DIAGNOSTICO_RUTA", os.path.join("logs", "trazas_ficha.jsonl"))
+
+_local = threading.local()
+_escritura = threading.Lock()
+
+class _Nulo:
+    # Contexto vacío compartido: lo que devuelve span() con la instrumentación apagada
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULO = _Nulo()
+
+class Traza:
+    """Registro de una ejecución: tramos cerrados (spans) y la pila de los abiertos."""
+
+    def __init__(self, contexto):
+        self.contexto = contexto
+        self.inicio = time.perf_counter()
+        self.spans = []
+        self.pila = []
+        self.seccion_abierta = None
+        self.cerrada = False
+
+    def abrir(self, nombre, tipo):
+        nodo = {'nombre': nombre, 'tipo': tipo, 'inicio': time.perf_counter(), 'filas': 0, 'calculo': False}
+        self.pila.append(nodo)
+        return nodo
+
+    def cerrar(self, nodo):
+        nodo['ms'] = (time.perf_counter() - nodo['inicio']) * 1000
+        if nodo in self.pila: self.pila.remove(nodo)
+        self.spans.append(nodo)
+
+class _Span:
+    def __init__(self, traza, nombre, tipo):
+        self.traza, self.nombre, self.tipo = traza, nombre, tipo
+
+    def __enter__(self):
+        self.nodo = self.traza.abrir(self.nombre, self.tipo)
+        return self
+
+    def __exit__(self, *exc):
+        self.traza.cerrar(self.nodo)
+        return False
+
+def _traza():
+    t = getattr(_local, 'traza', None)
+    return t if t is not None and not t.cerrada else None
+
+def activo():
+    return _traza() is not None
+
+def iniciar(activo=False, **contexto):
+    # Abre una traza nueva para esta ejecución (o deja la instrumentación apagada)
+    _local.traza = Traza(contexto) if activo else None
+
+def contexto(**valores):
+    t = _traza()
+    if t is not None: t.contexto.update(valores)
+
+def span(nombre, tipo="tramo"):
+    t = _traza()
+    return _Span(t, nombre, tipo) if t is not None else _NULO
+
+def seccion(nombre):
+    # Las secciones de la ficha son código de nivel superior: cada marca cierra la anterior
+    t = _traza()
+    if t is None: return
+    if t.seccion_abierta is not None: t.cerrar(t.seccion_abierta)
+    t.seccion_abierta = t.abrir(nombre, "seccion")
+
+def filas(n):
+    t = _traza()
+    if t is not None and t.pila: t.pila[-1]['filas'] += int(n)
+
+def marcar_calculo():
+    # Llamar dentro del cuerpo de una función cacheada: solo corre cuando la caché falla (miss)
+    t = _traza()
+    if t is None: return
+    for nodo in reversed(t.pila):
+        if nodo['tipo'] == "cache":
+            nodo['calculo'] = True
+            return
+
+def instrumentar(nombre=None, cache=False):
+    """Decorador de funciones auxiliares; con cache=True va por encima de @st.cache_data."""
+    def decorador(f):
+        etiqueta = nombre or f.__name__
+        tipo = "cache" if cache else "funcion"
+        @functools.wraps(f)
+        def envoltura(*args, **kwargs):
+            t = _traza()
+            if t is None: return f(*args, **kwargs)
+            with _Span(t, etiqueta, tipo):
+                return f(*args, **kwargs)
+        return envoltura
+    return decorador
+
+def instrumentar_streamlit(st):
+    # Envuelve una sola vez las llamadas de Streamlit que serializan payloads pesados (figuras
+    # Plotly, tablas); las sesiones sin traza solo pagan la consulta al thread-local. Se envuelven
+    # los métodos de DeltaGenerator (columnas, contenedores, expanders: col.plotly_chart) y los
+    # alias st.plotly_chart/st.dataframe, que quedaron ligados al importar streamlit.
+    DeltaGenerator = st.delta_generator.DeltaGenerator
+    if getattr(DeltaGenerator, '_diagnostico_instrumentado', False): return
+    for metodo in ("plotly_chart", "dataframe"):
+        envolver = instrumentar(f"st.{metodo}")
+        setattr(DeltaGenerator, metodo, envolver(getattr(DeltaGenerator, metodo)))
+        setattr(st, metodo, envolver(getattr(st, metodo)))
+    DeltaGenerator._diagnostico_instrumentado = True
+
+def resumen(traza=None):
+    # Agrega los spans por nombre: llamadas, tiempo total/máximo, hits/misses y filas
+    t = traza or _traza()
+    if t is None: return []
+    agg = {}
+    for s in t.spans:
+        r = agg.setdefault((s['tipo'], s['nombre']), {
+            'tipo': s['tipo'], 'nombre': s['nombre'], 'llamadas': 0, 'ms_total': 0.0, 'ms_max': 0.0,
+            'cache_hits': 0, 'cache_misses': 0, 'filas': 0
+        })
+        r['llamadas'] += 1
+        r['ms_total'] += s['ms']
+        r['ms_max'] = max(r['ms_max'], s['ms'])
+        r['filas'] += s['filas']
+        if s['tipo'] == "cache":
+            if s['calculo']: r['cache_misses'] += 1
+            else: r['cache_hits'] += 1
+    for r in agg.values():
+        r['ms_total'] = round(r['ms_total'], 2)
+        r['ms_max'] = round(r['ms_max'], 2)
+    return list(agg.values())
+
+def finalizar():
+    """Cierra la traza de la ejecución, la agrega al JSONL y la devuelve (None si está apagada)."""
+    t = _traza()
+    if t is None: return None
+    if t.seccion_abierta is not None: t.cerrar(t.seccion_abierta)
+    t.cerrada = True
+    registro = {
+        'ts': datetime.now().isoformat(timespec='milliseconds'),
+        'ms_total': round((time.perf_counter() - t.inicio) * 1000, 2),
+        **t.contexto,
+        'spans': resumen(t)
+    }
+    try:
+        if os.path.dirname(RUTA_TRAZAS): os.makedirs(os.path.dirname(RUTA_TRAZAS), exist_ok=True)
+        with _escritura, open(RUTA_TRAZAS, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+    except OSError:
+        pass  # el diagnóstico nunca debe tumbar la ficha
+    return registro
@@ -2,11 +2,25 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
 import os
 import textwrap
 import base64
 import zipfile
 import json
+import hashlib
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import diagnostico as diag
+import calculo_estatal as calc
+
+# Las secciones trabajan sobre vistas de las tablas compartidas (copia_local), lo que requiere
+# Copy-on-Write: siempre activo desde pandas 3.0, opcional en 2.x
+if int(pd.__version__.split('.')[0]) < 3: pd.set_option("mode.copy_on_write", True)
 
 # ==========================================
 # 1. CONFIGURACIÓN DE LA PÁGINA (BRANDING NAFIN/BANCOMEXT)
@@ -18,6 +32,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Diagnóstico de rendimiento (apagado por defecto): FICHA_DIAGNOSTICO=1 o ?diagnostico=1
+diag.instrumentar_streamlit(st)
+diag.iniciar(activo=diag.ACTIVO_ENV or st.query_params.get("diagnostico") == "1")
+
 # Estilos CSS Avanzados - Identidad Institucional
 st.markdown("""
 <style>
@@ -142,7 +160,7 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ==========================================
-# 2. CATÁLOGOS Y MAPEOS (SIN CAMBIOS)
+# 2. CATÁLOGOS Y MAPEOS
 # ==========================================
 STATE_MAP = {
     1: 'Aguascalientes', 2: 'Baja California', 3: 'Baja California Sur', 4: 'Campeche',
@@ -164,11 +182,147 @@ NAME_NORMALIZER = {
     'Mexico': 'México'
 }
 
+HIERARCHY = {
+    "Primario": {
+        "Total": "Actividades Primarias",
+        "Subsectores": ["Agricultura, cría y explotación de animales, aprovechamiento forestal, pesca y caza"],
+        "Actividades": ["Agricultura", "Cría y explotación de animales", "Pesca, caza y captura", "Aprovechamiento forestal"]
+    },
+    "Secundario": {
+        "Total": "Actividades Secundarias",
+        "Subsectores": ["Minería", "Generación, transmisión y distribución de energía eléctrica, agua y gas", "Construcción", "Industrias manufactureras"],
+        "Manufactura_Actividades": ["Industria alimentaria", "Bebidas y tabaco", "Insumos, acabados y productos textiles", "Prendas de vestir y productos de cuero y piel", "Industria de la madera", "Industria del papel", "Productos derivados del petróleo y carbón, química, plástico y hule", "Productos a base de minerales no metálicos", "Metálicas básicas y productos metálicos", "Maquinaria y equipo, computación, electrónicos y accesorios", "Muebles, colchones y persianas", "Otras industrias manufactureras"]
+    },
+    "Terciario": {
+        "Total": "Actividades Terciarias",
+        "Subsectores": ["Comercio al por mayor", "Comercio al por menor", "Transportes, correos y almacenamiento", "Información en medios masivos", "Servicios financieros y de seguros", "Servicios inmobiliarios y de alquiler de bienes", "Servicios profesionales, científicos y técnicos", "Corporativos", "Servicios de apoyo a los negocios y manejo de residuos", "Servicios educativos", "Servicios de salud y de asistencia social", "Servicios de esparcimiento culturales y deportivos", "Servicios de alojamiento temporal y de preparación de alimentos y bebidas", "Otros servicios excepto actividades gubernamentales", "Actividades legislativas, gubernamentales"]
+    }
+}
+
+INDICADORES_IGNORADOS = ["Acceso a internet"]
+CORRECCION_NOMBRES = {"Perc. de corrupción estatal": "Percepción de corrupción estatal"}
+
+TIPO_INDICADOR = {"Acceso a instituciones de salud": "Directo", "Camas de hospital": "Directo", "Captación de ahorro": "Directo", "Carga aérea": "Directo", "Cobertura educativa": "Directo", "Competencia en servicios notariales": "Directo", "Consulta info finanzas públicas": "Directo", "Crecimiento de UE >50 empleados": "Directo", "Crecimiento del PIB": "Directo", "Crecimiento puestos de trabajo (IMSS)": "Directo", "Diversificación económica": "Directo", "Esperanza de vida": "Directo", "Flujo de pasajeros aéreos": "Directo", "Grado de escolaridad": "Directo", "Ingreso promedio de tiempo completo": "Directo", "Ingresos propios": "Directo", "Mujeres económicamente activas": "Directo", "Participación ciudadana en elecciones": "Directo", "Patentes": "Directo", "Percepción de seguridad": "Directo", "Personal médico con especialidad": "Directo", "Personal médico y de enfermería": "Directo", "Población con educación superior": "Directo", "Tasa de participación": "Directo", "Terminales punto de venta": "Directo", "Uso de banca móvil": "Directo", "Agresiones a periodistas": "Inverso", "Brecha de ingresos por género": "Inverso", "Costo promedio de la deuda": "Inverso", "Delitos no denunciados": "Inverso", "Desigualdad salarial": "Inverso", "Deuda estatal y organismos": "Inverso", "Diferencia de informalidad laboral H-M": "Inverso", "Heridos en accidentes de tránsito terrestre": "Inverso", "Homicidios": "Inverso", "Incidencia delictiva": "Inverso", "Informalidad laboral": "Inverso", "Jornadas laborales >48h": "Inverso", "Morbilidad respiratoria": "Inverso", "Percepción de corrupción estatal": "Inverso", "Personas con ingresos debajo de la línea de bienestar": "Inverso", "Robo de vehículos": "Inverso"}
+
 # ==========================================
-# 3. CARGA DE DATOS (SIN CAMBIOS)
+# 3. CARGA DE DATOS
 # ==========================================
-@st.cache_data
-def load_data():
+@diag.instrumentar()
+def get_data_version():
+    # Huella de los insumos (nombre, tamaño y fecha de modificación): cambia cada vez que el ETL
+    # reescribe un archivo, lo que invalida la carga y todas las matrices precalculadas. Solo
+    # cuentan los archivos: las subcarpetas del ETL (checkpoints, caché HTTP) cambian en cada
+    # corrida aunque ningún insumo cambie.
+    firmas = []
+    for carpeta in [os.path.join("data", "intermediate"), os.path.join("data", "raw")]:
+        if not os.path.isdir(carpeta): continue
+        for nombre in sorted(os.listdir(carpeta)):
+            ruta = os.path.join(carpeta, nombre)
+            if not os.path.isfile(ruta): continue
+            info = os.stat(ruta)
+            firmas.append(f"{nombre}:{info.st_size}:{int(info.st_mtime)}")
+    return hashlib.md5("|".join(firmas).encode('utf-8')).hexdigest()[:12]
+
+# Tipado de los insumos: texto repetido (entidades, sectores, indicadores, periodos) como
+# categórico, enteros al tipo más chico que los contiene y flotantes a float32 cuando ningún
+# valor pasa de 2^24 (hasta ahí float32 representa exactos los enteros y conserva ~7 cifras).
+COLUMNAS_ENTIDAD = ['Estado', 'Entidad', 'ENTIDAD']
+PROPORCION_CATEGORICA = 0.5  # máx. valores distintos / filas para guardar texto como categórico
+LIMITE_FLOAT32 = 2 ** 24
+
+def a_numero(serie):
+    # Cifras IMSS/ANUIES que vienen como texto con separadores de miles o signo de pesos
+    if pd.api.types.is_numeric_dtype(serie): return serie
+    return pd.to_numeric(serie.astype(str).str.replace(',', '').str.replace(' ', '').str.replace('$', '', regex=False), errors='coerce')
+
+def memoria_kb(df):
+    return df.memory_usage(deep=True).sum() / 1024
+
+def tipar_frame(df):
+    df = df.copy(deep=False)
+    for col in df.columns:
+        serie = df[col]
+        if col in COLUMNAS_ENTIDAD:
+            # Nombres normalizados desde la carga: los .replace(NAME_NORMALIZER) de las secciones
+            # no pueden agregar valores nuevos a una columna categórica.
+            serie = serie.astype(str).str.strip().replace(NAME_NORMALIZER)
+        if pd.api.types.is_string_dtype(serie) or serie.dtype == object:
+            # Texto numérico ("141,271") se convierte una sola vez aquí
+            numero = a_numero(serie)
+            if numero.notna().sum() == serie.notna().sum() and serie.notna().any():
+                serie = numero
+            elif serie.nunique() <= PROPORCION_CATEGORICA * len(serie):
+                serie = serie.astype('category')
+        if pd.api.types.is_integer_dtype(serie):
+            serie = pd.to_numeric(serie, downcast='integer')
+        elif pd.api.types.is_float_dtype(serie) and serie.abs().max() < LIMITE_FLOAT32:
+            serie = serie.astype('float32')
+        df[col] = serie
+    return df
+
+def solo_lectura(arr):
+    arr = np.array(arr, copy=True)
+    arr.flags.writeable = False
+    return arr
+
+def congelar(df):
+    # Valores de solo lectura en la tabla compartida: ningún arreglo de columna es escribible
+    # (numéricos, objeto, códigos de las categóricas y texto). En numéricos y categóricas,
+    # df.loc/iloc[...] = ... sobre la tabla del almacén falla. El texto queda como un arreglo
+    # NumPy de objetos de solo lectura; pandas atiende una escritura ahí, igual que en el
+    # almacenamiento de Arrow de "str", reemplazando el arreglo de la columna. Eso, y agregar o
+    # reasignar columnas (df['a'] = ..., df['a'] += 1), no se puede impedir así: lo detecta
+    # verificar_datos. Las vistas de copia_local y los filtros sí pueden escribir: Copy-on-Write
+    # copia la columna tocada.
+    columnas = {}
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            columnas[col] = pd.Categorical.from_codes(solo_lectura(serie.cat.codes.to_numpy()), dtype=serie.dtype)
+        elif isinstance(serie.dtype, pd.StringDtype):
+            columnas[col] = solo_lectura(serie.to_numpy(dtype=object))
+        elif isinstance(serie.dtype, np.dtype) and serie.dtype.kind in 'biufMO':
+            columnas[col] = solo_lectura(serie.to_numpy())
+        else:
+            columnas[col] = serie.array
+    return pd.DataFrame(columnas, index=df.index, copy=False)
+
+def huella(df):
+    # Firma de contenido (columnas, forma y hash de valores) para detectar escrituras
+    return (tuple(df.columns), df.shape, int(pd.util.hash_pandas_object(df, index=True).sum()))
+
+def tipar_datos(data):
+    # Aplica el tipado a cada tabla y devuelve el reporte de memoria antes/después
+    reporte = []
+    for nombre, df in data.items():
+        if not isinstance(df, pd.DataFrame) or df.empty: continue
+        antes = memoria_kb(df)
+        data[nombre] = tipar_frame(df)
+        reporte.append({'dataset': nombre, 'filas': len(df), 'kb_antes': round(antes, 1), 'kb_despues': round(memoria_kb(data[nombre]), 1)})
+    return reporte
+
+def verificar_datos(data):
+    # Compara las tablas compartidas contra sus huellas de carga y reporta cualquier escritura
+    # que congelar no impide (columnas agregadas o reasignadas) hecha durante la ejecución
+    modificadas = [n for n, h in data.get('huellas', {}).items() if huella(data[n]) != h]
+    diag.contexto(escrituras_datos=modificadas)
+    return modificadas
+
+def copia_local(df, nombre):
+    # Única forma en que una sección toma una tabla del almacén compartido. Es una vista sin
+    # copiar datos: con Copy-on-Write, las columnas que la sección agregue o reasigne solo
+    # existen en la vista y el original nunca cambia. El diagnóstico registra cada vista.
+    with diag.span(f"vista:{nombre}", tipo="copia"):
+        diag.filas(len(df))
+        return df.copy(deep=False)
+
+# Almacén de datos del proceso: st.cache_resource entrega la misma instancia a todas las
+# sesiones (st.cache_data deserializaría una copia completa en cada llamada). Las tablas se
+# congelan al cargarse; las secciones que necesiten columnas propias usan copia_local.
+@diag.instrumentar("load_data", cache=True)
+@st.cache_resource(max_entries=2)
+def load_data(version):
+    diag.marcar_calculo()
     path = os.path.join("data", "intermediate")
     raw = os.path.join("data", "raw")
     data = {}
@@ -189,6 +343,7 @@ def load_data():
         data['saic'] = pd.read_csv(os.path.join(path, "saic_productividad.csv"))
         data['imco_g'] = pd.read_csv(os.path.join(path, "imco_general_final.csv"))
         data['imco_d'] = pd.read_csv(os.path.join(path, "imco_desagregado_final.csv"))
+        data['imco_d']['Indicador'] = data['imco_d']['Indicador'].replace(CORRECCION_NOMBRES)
         
         rat_path = os.path.join(raw, "ratings_estatales.xlsx")
         data['ratings'] = pd.read_excel(rat_path) if os.path.exists(rat_path) else pd.DataFrame()
@@ -203,18 +358,34 @@ def load_data():
                 data['fechas'] = json.load(f)
         else:
             data['fechas'] = {} # Fallback por si no encuentra el archivo
+
+        # Columnas de periodo derivadas una sola vez ("2024/03" -> 2024, "03")
+        data['export']['Year'] = data['export']['Periodo'].astype(str).str[:4].astype(int)
+        data['export']['Quarter'] = data['export']['Periodo'].astype(str).str[-2:]
+        # Clave de estado entera (0 = nacional, -1 si no se reconoce) para comparar sin convertir
+        for nombre in ('pib', 'export', 'pob'):
+            data[nombre]['Estado_ID'] = pd.to_numeric(data[nombre]['Estado_ID'], errors='coerce').fillna(-1).astype(int)
+
+        data['memoria'] = tipar_datos(data)
+        tablas = [k for k, v in data.items() if isinstance(v, pd.DataFrame)]
+        for nombre in tablas: data[nombre] = congelar(data[nombre])
+        data['huellas'] = {nombre: huella(data[nombre]) for nombre in tablas}
+        diag.filas(sum(len(v) for v in data.values() if isinstance(v, pd.DataFrame)))
             
     except Exception as e:
         st.error(f"Error cargando datos: {e}")
         return None
     return data
 
-DATA = load_data()
+diag.seccion("Carga de datos")
+DATA_VERSION = get_data_version()
+DATA = load_data(DATA_VERSION)
 if not DATA: st.stop()
 
 # ==========================================
 # 4. LOGOS INSTITUCIONALES & SIDEBAR
 # ==========================================
+diag.seccion("Sidebar")
 # Inyectar Logos de NAFIN y Bancomext en el Sidebar
 col_logo1, col_logo2 = st.sidebar.columns(2)
 try:
@@ -226,6 +397,9 @@ except Exception as e:
     st.sidebar.warning("Logos no encontrados en ruta 'logos/'")
 
 st.sidebar.markdown("<hr style='margin-top: 5px; margin-bottom: 15px;'>", unsafe_allow_html=True)
+vista = st.sidebar.radio("Vista", ["Ficha estatal", "Comparar estados", "Ranking nacional"], key='vista', label_visibility="collapsed")
+vista_ficha = vista == "Ficha estatal"
+
 st.sidebar.markdown("<h3 style='font-size: 1.1rem; color:#0F172A; margin-bottom: 10px;'>Selecciona Entidad</h3>", unsafe_allow_html=True)
 
 if 'estado_seleccionado' not in st.session_state:
@@ -248,11 +422,12 @@ for estado in list(STATE_MAP.values()):
 selected_name = st.session_state['estado_seleccionado']
 state_norm = NAME_NORMALIZER.get(selected_name, selected_name)
 state_id = NAME_TO_ID.get(state_norm)
-state_id_str = str(state_id).zfill(2)
+diag.contexto(estado=selected_name, vista=vista)
 
 # ==========================================
 # BOTÓN FLOTANTE DE DESCARGA DESDE ZIP
 # ==========================================
+diag.seccion("PDF y encabezado")
 # Cambiamos la ruta para que apunte a un único archivo ZIP comprimido
 ruta_zip = "fichas_pdf.zip" 
 nombre_pdf_interno = f"{selected_name}.pdf"
@@ -260,15 +435,15 @@ nombre_pdf_interno = f"{selected_name}.pdf"
 html_boton = ""
 pdf_encontrado = False
 
-# Verificamos si el archivo ZIP existe
-if os.path.exists(ruta_zip):
+# Verificamos si el archivo ZIP existe (las vistas comparativa y de ranking no tienen PDF propio)
+if vista_ficha and os.path.exists(ruta_zip):
     try:
         # Abrimos el ZIP en modo lectura
         with zipfile.ZipFile(ruta_zip, 'r') as zf:
             # Listamos los archivos internos para verificar que nuestro PDF esté ahí
             if nombre_pdf_interno in zf.namelist():
                 # Leemos el PDF directamente a la memoria RAM
-                with zf.open(nombre_pdf_interno) as f:
+                with zf.open(nombre_pdf_interno) as f, diag.span("pdf_base64"):
                     base64_pdf = base64.b64encode(f.read()).decode('utf-8')
                 pdf_encontrado = True
     except zipfile.BadZipFile:
@@ -312,7 +487,7 @@ if pdf_encontrado:
     </a>
     """
     st.markdown(html_boton, unsafe_allow_html=True)
-else:
+elif vista_ficha:
     # Aviso flotante si el ZIP no existe o falta el PDF adentro
     st.markdown("""
     <style>
@@ -324,28 +499,29 @@ else:
     <div class="floating-warning">Actualizando PDF...</div>
     """, unsafe_allow_html=True)
 
-# Encabezado Principal
-st.markdown(f"<h1 style='color: #2596be; font-size: 2.8rem;'>Ficha Técnica Estatal: {selected_name}</h1>", unsafe_allow_html=True)
-
-if 'gob_sedeco' in DATA and not DATA['gob_sedeco'].empty:
-    df_gob = DATA['gob_sedeco']
-    info_estado = df_gob[df_gob['Estado'].astype(str).str.strip() == selected_name]
-    if not info_estado.empty:
-        gobernador = info_estado['Gobernador/a'].values[0]
-        sedeco = info_estado['SEDECO'].values[0]
-        partido = info_estado['Partido'].values[0]
-        st.markdown(f"""
-        <div style='background-color: #E2E8F0; padding: 10px 15px; border-radius: 8px; margin-bottom: 20px; display: inline-block;'>
-            <span style='color: #475569; font-size: 0.9rem;'>
-            <b>Gobernador/a:</b> {gobernador} &nbsp;&nbsp;|&nbsp;&nbsp; <b>SEDECO:</b> {sedeco} &nbsp;&nbsp;|&nbsp;&nbsp; <b>Partido:</b> {partido}
-            </span>
-        </div>
-        """, unsafe_allow_html=True)
+# Encabezado Principal (las otras vistas usan su propio encabezado)
+if vista_ficha:
+    st.markdown(f"<h1 style='color: #2596be; font-size: 2.8rem;'>Ficha Técnica Estatal: {selected_name}</h1>", unsafe_allow_html=True)
+
+    if 'gob_sedeco' in DATA and not DATA['gob_sedeco'].empty:
+        df_gob = DATA['gob_sedeco']
+        info_estado = df_gob[df_gob['Estado'].astype(str).str.strip() == selected_name]
+        if not info_estado.empty:
+            gobernador = info_estado['Gobernador/a'].values[0]
+            sedeco = info_estado['SEDECO'].values[0]
+            partido = info_estado['Partido'].values[0]
+            st.markdown(f"""
+            <div style='background-color: #E2E8F0; padding: 10px 15px; border-radius: 8px; margin-bottom: 20px; display: inline-block;'>
+                <span style='color: #475569; font-size: 0.9rem;'>
+                <b>Gobernador/a:</b> {gobernador} &nbsp;&nbsp;|&nbsp;&nbsp; <b>SEDECO:</b> {sedeco} &nbsp;&nbsp;|&nbsp;&nbsp; <b>Partido:</b> {partido}
+                </span>
+            </div>
+            """, unsafe_allow_html=True)
 
-st.markdown("<p style='text-align: left; color: #94A3B8; font-size: 0.85rem; margin-top: -10px;'><i>MDP: Millones de Pesos &nbsp;|&nbsp; MDD: Millones de Dólares</i></p>", unsafe_allow_html=True)
+    st.markdown("<p style='text-align: left; color: #94A3B8; font-size: 0.85rem; margin-top: -10px;'><i>MDP: Millones de Pesos &nbsp;|&nbsp; MDD: Millones de Dólares</i></p>", unsafe_allow_html=True)
 
 # ==========================================
-# 5. FUNCIONES LÓGICAS (SIN CAMBIOS)
+# 5. FUNCIONES LÓGICAS
 # ==========================================
 def format_mm_pesos(val_millones):
     return f"${val_millones:,.0f} <span style='font-size: 0.5em; color:#64748B;'>MDP</span>"
@@ -383,9 +559,9 @@ def render_card(title, val_str, rank, top1, part, growth, growth_nac, fecha_act=
     </div>
     """, unsafe_allow_html=True)
 
+@diag.instrumentar()
 def get_pib_metrics(df, indicador, id_estado_int):
-    df = df.copy()
-    df['Estado_ID'] = pd.to_numeric(df['Estado_ID'], errors='coerce').fillna(-1).astype(int)
+    diag.filas(len(df))
     df_ind = df[df['Indicador'] == indicador]
     if df_ind.empty: return None
     max_period = df_ind['Periodo'].max()
@@ -397,36 +573,24 @@ def get_pib_metrics(df, indicador, id_estado_int):
     growth_est = ((est_curr - est_prev)/est_prev * 100) if est_prev > 0 else 0
     growth_nac = ((nac_curr - nac_prev)/nac_prev * 100) if nac_prev > 0 else 0
     part_nac = (est_curr / nac_curr * 100) if nac_curr > 0 else 0
-    df_rank = df_ind[(df_ind['Periodo'] == max_period) & (df_ind['Estado_ID'] != 0)].copy()
-    df_rank['Rank'] = df_rank['Valor'].rank(ascending=False)
-    try:
-        rank = int(df_rank[df_rank['Estado_ID'] == id_estado_int]['Rank'].values[0])
-        top1_row = df_rank[df_rank['Rank'] == 1].iloc[0]
-        top1_name = STATE_MAP.get(top1_row['Estado_ID'], "N/A")
-    except: rank=0; top1_name="-"
+    clave = ("PIB", "PIB (MDP)") if indicador == "Total Nacional" else ("PIB por Actividad (MDP)", indicador)
+    rank, top1_name = get_rank_nacional(clave, STATE_MAP.get(id_estado_int))
     return est_curr, part_nac, growth_est, growth_nac, rank, top1_name, max_period
 
-def get_export_metrics(df, id_estado_str):
-    df['Year'] = df['Periodo'].astype(str).str[:4].astype(int)
-    df['Quarter'] = df['Periodo'].astype(str).str[-2:]
+@diag.instrumentar()
+def get_export_metrics(df, id_estado_int):
+    diag.filas(len(df))
     max_year = df['Year'].max()
     quarters_avail = df[df['Year'] == max_year]['Quarter'].unique()
     df_total = df[df['Sector'] == 'Total']
-    est_curr = df_total[(df_total['Year'] == max_year) & (df_total['Estado_ID'].astype(str).str.zfill(2) == id_estado_str)]['Valor'].sum()
-    est_prev = df_total[(df_total['Year'] == (max_year-1)) & (df_total['Estado_ID'].astype(str).str.zfill(2) == id_estado_str) & (df_total['Quarter'].isin(quarters_avail))]['Valor'].sum()
+    est_curr = df_total[(df_total['Year'] == max_year) & (df_total['Estado_ID'] == id_estado_int)]['Valor'].sum()
+    est_prev = df_total[(df_total['Year'] == (max_year-1)) & (df_total['Estado_ID'] == id_estado_int) & (df_total['Quarter'].isin(quarters_avail))]['Valor'].sum()
     nac_curr = df_total[df_total['Year'] == max_year]['Valor'].sum()
     nac_prev = df_total[(df_total['Year'] == (max_year-1)) & (df_total['Quarter'].isin(quarters_avail))]['Valor'].sum()
     growth_est = ((est_curr - est_prev)/est_prev * 100) if est_prev > 0 else 0
     growth_nac = ((nac_curr - nac_prev)/nac_prev * 100) if nac_prev > 0 else 0
     part_nac = (est_curr / nac_curr * 100) if nac_curr > 0 else 0
-    df_agg = df_total[df_total['Year'] == max_year].groupby('Estado_ID')['Valor'].sum().reset_index()
-    df_agg['Rank'] = df_agg['Valor'].rank(ascending=False)
-    try:
-        df_agg['ID_Str'] = df_agg['Estado_ID'].astype(str).str.zfill(2)
-        rank = int(df_agg[df_agg['ID_Str'] == id_estado_str]['Rank'].values[0])
-        top1_row = df_agg[df_agg['Rank'] == 1].iloc[0]
-        top1_name = STATE_MAP.get(int(top1_row['Estado_ID']), "N/A")
-    except: rank=0; top1_name="-"
+    rank, top1_name = get_rank_nacional(("Exportaciones", "Exportaciones (MDD)"), STATE_MAP.get(id_estado_int))
     num_trimestres = len(quarters_avail)
     # Nueva condición:
     if num_trimestres == 4:
@@ -438,8 +602,61 @@ def get_export_metrics(df, id_estado_str):
         
     return est_curr, part_nac, growth_est, growth_nac, rank, top1_name, trim_str
 
+@diag.instrumentar()
+def get_export_ytd_matrix(df):
+    # Pivote [año x estado x sector] del acumulado alineado por trimestres (YTD) del año más
+    # reciente y del mismo tramo del año anterior. Base común de las matrices de exportación.
+    # La columna 'Total' se conserva aparte: la suma de sectores no la iguala porque INEGI
+    # reserva por confidencialidad parte del desglose sectorial de algunos estados.
+    diag.filas(len(df))
+    year, quarter = df['Year'], df['Quarter']
+    max_year = year.max()
+    quarters_avail = quarter[year == max_year].unique()
+
+    mask = year.isin([max_year, max_year - 1]) & quarter.isin(quarters_avail)
+    df_ytd = pd.DataFrame({
+        'Year': year[mask],
+        'Estado_ID': df.loc[mask, 'Estado_ID'],
+        'Sector': df.loc[mask, 'Sector'],
+        'Valor': df.loc[mask, 'Valor']
+    })
+    mat = df_ytd.pivot_table(index=['Year', 'Estado_ID'], columns='Sector', values='Valor', aggfunc='sum', fill_value=0)
+    return mat, int(max_year)
+
+@diag.instrumentar("get_export_diversification", cache=True)
+@st.cache_resource(max_entries=2)
+def get_export_diversification(_data, version):
+    # Indicadores de concentración calculados una sola vez para los 32 estados;
+    # en cada clic solo se consulta la fila del estado.
+    diag.marcar_calculo()
+    mat, max_year = get_export_ytd_matrix(_data['export'])
+    mat = mat.drop(columns='Total', errors='ignore')
+
+    vals = np.clip(mat.to_numpy(dtype=float), 0, None)
+    totales = vals.sum(axis=1, keepdims=True)
+    shares = np.divide(vals, totales, out=np.zeros_like(vals), where=totales > 0)
+    shares_desc = -np.sort(-shares, axis=1)
+    p_log_p = np.where(shares > 0, shares * np.log(np.where(shares > 0, shares, 1)), 0)
+
+    div = pd.DataFrame({
+        'HHI': (shares ** 2).sum(axis=1) * 10000,
+        'Top3': shares_desc[:, :3].sum(axis=1) * 100,
+        'Entropia': -p_log_p.sum(axis=1) / np.log(max(shares.shape[1], 2)),
+        'Sectores': (shares > 0).sum(axis=1)
+    }, index=mat.index)
+    div = div[totales[:, 0] > 0]
+
+    # Rank 1 = canasta exportadora más diversificada del periodo
+    grp = div.groupby(level='Year')
+    div['Rank_HHI'] = grp['HHI'].rank(ascending=True, method='min').astype(int)
+    div['Rank_Top3'] = grp['Top3'].rank(ascending=True, method='min').astype(int)
+    div['Rank_Entropia'] = grp['Entropia'].rank(ascending=False, method='min').astype(int)
+    return div, max_year
+
+@diag.instrumentar()
 def get_ied_metrics(df_tot, state_norm):
-    df_tot = df_tot.copy()
+    diag.filas(len(df_tot))
+    df_tot = df_tot.copy(deep=False)
     df_tot['Estado_Norm'] = df_tot['Estado'].replace(NAME_NORMALIZER)
     try:
         max_year = int(df_tot['Anio'].max())
@@ -456,7 +673,6 @@ def get_ied_metrics(df_tot, state_norm):
     except: 
         trim_str = "N/A"
     df_agg = df_tot.groupby('Estado_Norm')[['Inversion', 'Inversion_Anterior']].sum().reset_index()
-    df_agg['Rank'] = df_agg['Inversion'].rank(ascending=False)
     nac_curr = df_agg['Inversion'].sum()
     nac_prev = df_agg['Inversion_Anterior'].sum()
     growth_nac = ((nac_curr - nac_prev)/nac_prev * 100) if nac_prev > 0 else 0
@@ -466,10 +682,590 @@ def get_ied_metrics(df_tot, state_norm):
     est_prev = row['Inversion_Anterior'].values[0]
     growth_est = ((est_curr - est_prev)/est_prev * 100) if est_prev > 0 else 0
     part_nac = (est_curr / nac_curr * 100) if nac_curr > 0 else 0
-    rank = int(row['Rank'].values[0])
-    top1 = df_agg.sort_values('Inversion', ascending=False).iloc[0]['Estado_Norm']
+    rank, top1 = get_rank_nacional(("IED", "IED (MDD)"), state_norm)
     return est_curr, part_nac, growth_est, growth_nac, rank, top1, trim_str
 
+@diag.instrumentar("get_similarity_matrix", cache=True)
+@st.cache_resource(max_entries=2)
+def get_similarity_matrix(_data, version):
+    # Vectores de estructura económica por estado (participaciones del PIB, mezcla exportadora,
+    # tasas laborales ENOE y posiciones IMCO). Cada bloque se estandariza (z-score) y se pondera
+    # por 1/sqrt(n) para que ninguno domine por número de variables; la matriz 32x32 de
+    # similitud coseno se calcula una sola vez por versión de datos.
+    diag.marcar_calculo()
+    ids = list(STATE_MAP.keys())
+    nombres = [STATE_MAP[i] for i in ids]
+    bloques = []
+
+    # 1. PIB: participación de cada subsector de HIERARCHY en el PIB estatal
+    df_pib = _data['pib']
+    df_max = df_pib[df_pib['Periodo'] == df_pib['Periodo'].max()]
+    piv_pib = df_max.pivot_table(index='Estado_ID', columns='Indicador', values='Valor', aggfunc='sum').reindex(ids)
+    subsectores = [ind for meta in HIERARCHY.values() for ind in meta['Subsectores'] if ind in piv_pib.columns]
+    bloques.append(('PIB', piv_pib[subsectores].div(piv_pib['Total Nacional'], axis=0) * 100))
+
+    # 2. Exportaciones: mezcla sectorial del acumulado más reciente
+    mat_exp, max_y = get_export_ytd_matrix(_data['export'])
+    exp_curr = mat_exp.drop(columns='Total', errors='ignore').xs(max_y, level='Year').reindex(ids).fillna(0)
+    bloques.append(('Exportaciones', exp_curr.div(exp_curr.sum(axis=1).replace(0, np.nan), axis=0) * 100))
+
+    # 3. ENOE: tasas del mercado laboral
+    df_enoe = _data['enoe'].assign(Estado_Norm=_data['enoe']['Estado'].replace(NAME_NORMALIZER))
+    enoe = df_enoe.drop_duplicates('Estado_Norm').set_index('Estado_Norm').reindex(nombres)
+    enoe.index = ids
+    ocupados = enoe[['Sector Primario', 'Sector Secundario', 'Sector Terciario', 'No especificado']].sum(axis=1).replace(0, np.nan)
+    bloques.append(('ENOE', pd.DataFrame({
+        'Tasa de participación': enoe['PEA'] / enoe['Poblacion Total'] * 100,
+        'Tasa de desocupación': enoe['Desocupada'] / enoe['PEA'] * 100,
+        'Tasa de informalidad': enoe['Informalidad TIL1'],
+        'Empleo sector primario': enoe['Sector Primario'] / ocupados * 100,
+        'Empleo sector secundario': enoe['Sector Secundario'] / ocupados * 100,
+        'Empleo sector terciario': enoe['Sector Terciario'] / ocupados * 100,
+        'Edad promedio PEA': enoe['Edad Promedio PEA']
+    })))
+
+    # 4. IMCO: posición en cada indicador desagregado
+    df_imco = _data['imco_d'].assign(Entidad_Norm=_data['imco_d']['Entidad'].str.strip().replace(NAME_NORMALIZER))
+    piv_imco = df_imco.pivot_table(index='Entidad_Norm', columns='Indicador', values='Rank', aggfunc='first').reindex(nombres)
+    piv_imco.index = ids
+    bloques.append(('IMCO', piv_imco))
+
+    matrices, features = [], []
+    for bloque, df_b in bloques:
+        vals = df_b.to_numpy(dtype=float)
+        mean = np.nanmean(vals, axis=0)
+        std = np.nanstd(vals, axis=0)
+        z = np.divide(vals - mean, std, out=np.zeros_like(vals), where=std > 0)
+        matrices.append(np.nan_to_num(z) / np.sqrt(max(vals.shape[1], 1)))
+        features += [f"{bloque}: {c}" for c in df_b.columns]
+
+    X = np.hstack(matrices)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    X = np.divide(X, norms, out=np.zeros_like(X), where=norms > 0)
+    return {'ids': np.array(ids), 'features': np.array(features), 'X': X, 'sim': X @ X.T}
+
+@diag.instrumentar()
+def get_similar_states(sim_data, id_estado_int, k=5):
+    ids = sim_data['ids']
+    pos = np.flatnonzero(ids == id_estado_int)
+    if pos.size == 0: return []
+    i = pos[0]
+    row = sim_data['sim'][i].copy()
+    row[i] = -np.inf
+    res = []
+    for j in np.argsort(-row)[:k]:
+        # Rasgos que más aportan a la similitud: producto de ambos vectores por variable
+        contrib = sim_data['X'][i] * sim_data['X'][j]
+        rasgos = [(sim_data['features'][f], sim_data['X'][i, f] > 0) for f in np.argsort(-contrib)[:3] if contrib[f] > 0]
+        res.append({'Estado': STATE_MAP[int(ids[j])], 'Similitud': float(row[j]), 'Rasgos': rasgos})
+    return res
+
+@diag.instrumentar("get_zscore_matrix", cache=True)
+@st.cache_resource(max_entries=2)
+def get_zscore_matrix(_data, version):
+    # Matriz estandarizada [estado x indicador] para el índice compuesto: cada columna es un
+    # z-score orientado (signo invertido en indicadores "Inverso"), de modo que cualquier
+    # combinación de pesos se resuelve con un solo producto matriz-vector.
+    diag.marcar_calculo()
+    ids = list(STATE_MAP.keys())
+    nombres = [STATE_MAP[i] for i in ids]
+    columnas, direccion, grupo = {}, {}, {}
+
+    # 1. Indicadores desagregados IMCO (dirección según TIPO_INDICADOR)
+    df_imco = _data['imco_d'][~_data['imco_d']['Indicador'].isin(INDICADORES_IGNORADOS)]
+    df_imco = df_imco.assign(
+        Entidad_Norm=df_imco['Entidad'].str.strip().replace(NAME_NORMALIZER),
+        Indicador=df_imco['Indicador'].replace(CORRECCION_NOMBRES).astype(str).str.strip()
+    )
+    piv_imco = df_imco.pivot_table(index='Entidad_Norm', columns='Indicador', values='Value', aggfunc='first').reindex(nombres)
+    sub_imco = df_imco.drop_duplicates('Indicador').set_index('Indicador')['Subíndice']
+    for ind in piv_imco.columns:
+        columnas[ind] = piv_imco[ind].to_numpy(dtype=float)
+        direccion[ind] = -1 if TIPO_INDICADOR.get(ind, "Directo") == "Inverso" else 1
+        grupo[ind] = f"IMCO: {sub_imco.get(ind, '')}"
+
+    # 2. Crecimiento del PIB estatal (último año disponible)
+    df_pib = _data['pib'][_data['pib']['Indicador'] == "Total Nacional"]
+    piv_pib = df_pib.pivot_table(index='Estado_ID', columns='Periodo', values='Valor', aggfunc='sum').reindex(ids)
+    if piv_pib.shape[1] >= 2:
+        p_curr, p_prev = piv_pib.columns.max(), piv_pib.columns.max() - 1
+        if p_prev in piv_pib.columns:
+            columnas["Crecimiento PIB estatal (%)"] = ((piv_pib[p_curr] / piv_pib[p_prev] - 1) * 100).to_numpy(dtype=float)
+
+    # 3. Crecimiento de exportaciones (acumulado YTD vs mismo tramo del año anterior)
+    mat_exp, max_y = get_export_ytd_matrix(_data['export'])
+    tot_exp = mat_exp['Total'].unstack('Year').reindex(ids)
+    if max_y - 1 in tot_exp.columns:
+        columnas["Crecimiento de exportaciones (%)"] = ((tot_exp[max_y] / tot_exp[max_y - 1].replace(0, np.nan) - 1) * 100).to_numpy(dtype=float)
+
+    # 4. IED acumulada del periodo
+    df_ied = _data['ied_tot'].assign(Estado_Norm=_data['ied_tot']['Estado'].replace(NAME_NORMALIZER))
+    columnas["IED (MDD)"] = df_ied.groupby('Estado_Norm')['Inversion'].sum().reindex(nombres).to_numpy(dtype=float)
+
+    # 5. Tasas del mercado laboral (ENOE)
+    df_enoe = _data['enoe'].assign(Estado_Norm=_data['enoe']['Estado'].replace(NAME_NORMALIZER))
+    enoe = df_enoe.drop_duplicates('Estado_Norm').set_index('Estado_Norm').reindex(nombres)
+    columnas["Tasa de participación laboral (%)"] = (enoe['PEA'] / enoe['Poblacion Total'] * 100).to_numpy(dtype=float)
+    columnas["Tasa de desocupación (%)"] = (enoe['Desocupada'] / enoe['PEA'] * 100).to_numpy(dtype=float)
+    columnas["Tasa de informalidad laboral (%)"] = enoe['Informalidad TIL1'].to_numpy(dtype=float)
+    direccion["Tasa de desocupación (%)"] = -1
+    direccion["Tasa de informalidad laboral (%)"] = -1
+
+    indicadores = list(columnas.keys())
+    vals = np.column_stack([columnas[c] for c in indicadores])
+    mean = np.nanmean(vals, axis=0)
+    std = np.nanstd(vals, axis=0)
+    Z = np.divide(vals - mean, std, out=np.zeros_like(vals), where=std > 0)
+    Z = np.nan_to_num(Z) * np.array([direccion.get(c, 1) for c in indicadores])
+    return {
+        'estados': np.array(nombres),
+        'indicadores': indicadores,
+        'grupos': [grupo.get(c, "Economía y mercado laboral") for c in indicadores],
+        'Z': Z
+    }
+
+# Catálogo de la vista comparativa: (sección, indicador, formato, mejor valor). "mejor" indica
+# qué extremo se resalta entre los estados comparados; None = indicador sin orientación.
+METRICAS_COMPARACION = [
+    ("PIB", "PIB (MDP)", "${:,.0f}", "max"),
+    ("PIB", "PIB Manufactura (MDP)", "${:,.0f}", "max"),
+    ("PIB", "Var. Anual PIB (%)", "{:+.1f}%", "max"),
+    ("PIB", "Part. Nacional PIB (%)", "{:.1f}%", "max"),
+    ("Exportaciones", "Exportaciones (MDD)", "${:,.0f}", "max"),
+    ("Exportaciones", "Var. Anual Exportaciones (%)", "{:+.1f}%", "max"),
+    ("Exportaciones", "Índice HHI Exportador", "{:,.0f}", "min"),
+    ("IED", "IED (MDD)", "${:,.0f}", "max"),
+    ("IED", "Var. Anual IED (%)", "{:+.1f}%", "max"),
+    ("Remesas", "Remesas Trimestrales (MDD)", "${:,.0f}", "max"),
+    ("Remesas", "Var. Trimestral Remesas (%)", "{:+.1f}%", "max"),
+    ("Mercado Laboral (ENOE)", "Población Total", "{:,.0f}", None),
+    ("Mercado Laboral (ENOE)", "Tasa Desocupación (%)", "{:.1f}%", "min"),
+    ("Mercado Laboral (ENOE)", "Tasa Informalidad (%)", "{:.1f}%", "min"),
+    ("Mercado Laboral (ENOE)", "Edad Promedio PEA (años)", "{:.1f}", None),
+    ("Empleo Formal (IMSS)", "Puestos de Trabajo IMSS", "{:,.0f}", "max"),
+    ("Empleo Formal (IMSS)", "Var. Anual Puestos (%)", "{:+.1f}%", "max"),
+    ("Empleo Formal (IMSS)", "Salario Diario IMSS", "${:,.2f}", "max"),
+    ("Productividad", "Productividad Laboral", "{:,.2f}", "max"),
+    ("Educación Superior", "Matrícula Total", "{:,.0f}", "max"),
+    ("Educación Superior", "Egresados Total", "{:,.0f}", "max"),
+    ("Competitividad (IMCO)", "Índice General IMCO", "{:.2f}", "max"),
+    ("Competitividad (IMCO)", "Posición IMCO", "#{:.0f}", "min"),
+]
+
+@diag.instrumentar("get_series_imss", cache=True)
+@st.cache_resource(max_entries=2)
+def get_series_imss(_data, version):
+    # Series mensuales IMSS [mes x estado] numéricas y en orden cronológico, compartidas por
+    # las matrices nacionales (índice = "Mes Año" para etiquetar las mini-gráficas).
+    diag.marcar_calculo()
+    nombres = list(STATE_MAP.values())
+    meses_map = {'enero':1, 'febrero':2, 'marzo':3, 'abril':4, 'mayo':5, 'junio':6, 'julio':7, 'agosto':8, 'septiembre':9, 'octubre':10, 'noviembre':11, 'diciembre':12}
+
+    df_pue = _data['imss_pue'].rename(columns=NAME_NORMALIZER)
+    orden_pue = (df_pue['Año'].astype(int) * 100 + df_pue['Mes'].str.lower().str.strip().map(meses_map)).sort_values().index
+    pue = df_pue.loc[orden_pue].reindex(columns=nombres).apply(a_numero)
+    pue.index = df_pue.loc[orden_pue, 'Mes'].str.capitalize() + ' ' + df_pue.loc[orden_pue, 'Año'].astype(str)
+
+    df_sal = _data['imss_sal'].rename(columns=NAME_NORMALIZER)
+    fecha_sal = df_sal['Fecha'].str.split(' ', expand=True)
+    orden_sal = (fecha_sal[1].astype(int) * 100 + fecha_sal[0].str.lower().str.strip().map(meses_map)).sort_values().index
+    sal = df_sal.loc[orden_sal].reindex(columns=nombres).apply(a_numero)
+    sal.index = df_sal.loc[orden_sal, 'Fecha'].str.title()
+
+    return {'puestos': pue.dropna(how='all'), 'salario': sal.dropna(how='all')}
+
+@diag.instrumentar("get_metric_matrix", cache=True)
+@st.cache_resource(max_entries=2)
+def get_metric_matrix(_data, version):
+    # Matriz [indicador x estado] con las cifras principales de cada sección de la ficha,
+    # calculada una sola vez por versión de datos: comparar N estados es tomar N columnas.
+    diag.marcar_calculo()
+    ids = list(STATE_MAP.keys())
+    nombres = [STATE_MAP[i] for i in ids]
+    filas = {}
+
+    # 1. PIB (último año vs anterior)
+    df_pib = _data['pib']
+    p_curr = df_pib['Periodo'].max()
+    piv_pib = df_pib[df_pib['Periodo'] == p_curr].pivot_table(index='Estado_ID', columns='Indicador', values='Valor', aggfunc='sum')
+    pib_prev = df_pib[(df_pib['Periodo'] == p_curr - 1) & (df_pib['Indicador'] == "Total Nacional")].groupby('Estado_ID')['Valor'].sum()
+    pib_tot = piv_pib['Total Nacional']
+    filas["PIB (MDP)"] = pib_tot.reindex(ids)
+    filas["PIB Manufactura (MDP)"] = piv_pib.get("Industrias manufactureras", pd.Series(dtype=float)).reindex(ids)
+    filas["Var. Anual PIB (%)"] = ((pib_tot / pib_prev.replace(0, np.nan) - 1) * 100).reindex(ids)
+    filas["Part. Nacional PIB (%)"] = (pib_tot / pib_tot.get(0, np.nan) * 100).reindex(ids)
+
+    # 2. Exportaciones (acumulado YTD alineado por trimestres, en MDD)
+    mat_exp, max_y = get_export_ytd_matrix(_data['export'])
+    tot_exp = mat_exp['Total'].unstack('Year').reindex(ids)
+    filas["Exportaciones (MDD)"] = tot_exp[max_y] / 1000
+    if max_y - 1 in tot_exp.columns:
+        filas["Var. Anual Exportaciones (%)"] = (tot_exp[max_y] / tot_exp[max_y - 1].replace(0, np.nan) - 1) * 100
+    div, _ = get_export_diversification(_data, version)
+    filas["Índice HHI Exportador"] = div.xs(max_y, level='Year')['HHI'].reindex(ids)
+
+    # 3. IED acumulada del periodo
+    df_ied = _data['ied_tot'].assign(Estado_Norm=_data['ied_tot']['Estado'].replace(NAME_NORMALIZER))
+    ied = df_ied.groupby('Estado_Norm')[['Inversion', 'Inversion_Anterior']].sum().reindex(nombres)
+    filas["IED (MDD)"] = ied['Inversion'].set_axis(ids)
+    filas["Var. Anual IED (%)"] = ((ied['Inversion'] / ied['Inversion_Anterior'].where(ied['Inversion_Anterior'] > 0) - 1) * 100).set_axis(ids)
+
+    # 4. Remesas (último trimestre publicado vs anterior)
+    df_rem = _data['remesas'].assign(fecha=pd.to_datetime(_data['remesas']['fecha'], errors='coerce'))
+    df_rem = df_rem.dropna(subset=['fecha', 'Total']).sort_values('fecha').rename(columns=NAME_NORMALIZER)
+    if len(df_rem) > 1:
+        rem_curr, rem_prev = df_rem.iloc[-1].reindex(nombres).astype(float), df_rem.iloc[-2].reindex(nombres).astype(float)
+        filas["Remesas Trimestrales (MDD)"] = rem_curr.set_axis(ids)
+        filas["Var. Trimestral Remesas (%)"] = ((rem_curr / rem_prev.where(rem_prev > 0) - 1) * 100).set_axis(ids)
+
+    # 5. ENOE
+    df_enoe = _data['enoe'].assign(Estado_Norm=_data['enoe']['Estado'].replace(NAME_NORMALIZER))
+    enoe = df_enoe.drop_duplicates('Estado_Norm').set_index('Estado_Norm').reindex(nombres).set_axis(ids)
+    filas["Población Total"] = enoe['Poblacion Total']
+    filas["Tasa Desocupación (%)"] = enoe['Desocupada'] / enoe['PEA'].replace(0, np.nan) * 100
+    filas["Tasa Informalidad (%)"] = enoe['Informalidad TIL1']
+    filas["Edad Promedio PEA (años)"] = enoe['Edad Promedio PEA']
+
+    # 6. IMSS: puestos (último mes, var. anual) y salario diario
+    imss = get_series_imss(_data, version)
+    pue, sal = imss['puestos'], imss['salario']
+    if not pue.empty:
+        filas["Puestos de Trabajo IMSS"] = pue.iloc[-1].set_axis(ids)
+        if len(pue) > 12:
+            filas["Var. Anual Puestos (%)"] = ((pue.iloc[-1] / pue.iloc[-13] - 1) * 100).set_axis(ids)
+    if not sal.empty:
+        filas["Salario Diario IMSS"] = sal.iloc[-1].set_axis(ids)
+
+    # 7. Productividad (SAIC)
+    saic = _data['saic'].assign(Entidad_Norm=_data['saic']['Entidad'].str.strip().replace(NAME_NORMALIZER))
+    filas["Productividad Laboral"] = saic.groupby('Entidad_Norm')['Indicador_Productividad'].first().reindex(nombres).set_axis(ids)
+
+    # 8. Educación superior (todos los niveles)
+    edu = _data['edu_tot'].assign(ENTIDAD=_data['edu_tot']['ENTIDAD'].astype(str).str.strip().replace(NAME_NORMALIZER))
+    edu_agg = edu.groupby('ENTIDAD')[['Matrícula Total', 'Egresados Total']].agg(lambda s: a_numero(s).sum()).reindex(nombres).set_axis(ids)
+    filas["Matrícula Total"] = edu_agg['Matrícula Total']
+    filas["Egresados Total"] = edu_agg['Egresados Total']
+
+    # 9. IMCO general
+    imco = _data['imco_g'].assign(Entidad_Norm=_data['imco_g']['Entidad'].str.strip().replace(NAME_NORMALIZER))
+    imco = imco.drop_duplicates('Entidad_Norm').set_index('Entidad_Norm').reindex(nombres).set_axis(ids)
+    filas["Índice General IMCO"] = imco['Valor']
+    filas["Posición IMCO"] = imco['Ranking']
+
+    indicadores = [m[1] for m in METRICAS_COMPARACION]
+    matriz = pd.DataFrame({k: pd.to_numeric(v, errors='coerce').to_numpy(dtype=float) for k, v in filas.items()}, index=nombres).T
+    return matriz.reindex(indicadores)
+
+@diag.instrumentar("get_rank_matrix", cache=True)
+@st.cache_resource(max_entries=2)
+def get_rank_matrix(_data, version):
+    # Posiciones nacionales [(sección, indicador) x estado] de todos los indicadores de la ficha,
+    # con el orden 1-32 ya resuelto y la serie histórica de cada uno para las mini-gráficas.
+    # Se calcula una vez por versión de datos; tarjetas y página de ranking solo consultan.
+    diag.marcar_calculo()
+    ids = list(STATE_MAP.keys())
+    nombres = [STATE_MAP[i] for i in ids]
+    bloques, ascendente, formatos, tendencias = [], {}, {}, {}
+
+    def por_estado_id(piv):
+        # Columnas Estado_ID -> nombre oficial de STATE_MAP
+        return piv.reindex(columns=ids).set_axis(nombres, axis=1)
+
+    # 1. Indicadores principales (mismo catálogo que la vista comparativa)
+    claves = [(m[0], m[1]) for m in METRICAS_COMPARACION]
+    bloques.append(get_metric_matrix(_data, version).set_axis(pd.MultiIndex.from_tuples(claves), axis=0))
+    for sec, ind, fmt, mejor in METRICAS_COMPARACION:
+        ascendente[(sec, ind)] = mejor == "min"
+        formatos[(sec, ind)] = fmt
+
+    # 2. PIB por actividad (último año) y su historia anual
+    df_pib = _data['pib']
+    hist_pib = df_pib.pivot_table(index=['Indicador', 'Estado_ID'], columns='Periodo', values='Valor', aggfunc='sum')
+    piv_pib = por_estado_id(hist_pib[hist_pib.columns.max()].unstack('Estado_ID').drop(index="Total Nacional", errors='ignore'))
+    bloques.append(pd.concat({"PIB por Actividad (MDP)": piv_pib}))
+    for ind in piv_pib.index: formatos[("PIB por Actividad (MDP)", ind)] = "${:,.0f}"
+    for ind in hist_pib.index.get_level_values('Indicador').unique():
+        serie = hist_pib.xs(ind, level='Indicador').reindex(ids).set_axis(nombres)
+        if ind == "Total Nacional": tendencias[("PIB", "PIB (MDP)")] = serie
+        else: tendencias[("PIB por Actividad (MDP)", ind)] = serie
+    tendencias[("PIB", "PIB Manufactura (MDP)")] = tendencias.get(("PIB por Actividad (MDP)", "Industrias manufactureras"))
+
+    # 3. Exportaciones por sector (acumulado del año más reciente) e historia trimestral
+    mat_exp, max_y = get_export_ytd_matrix(_data['export'])
+    piv_exp = por_estado_id(mat_exp.xs(max_y, level='Year').T) / 1000
+    bloques.append(pd.concat({"Exportaciones por Sector (MDD)": piv_exp.drop(index='Total', errors='ignore')}))
+    for sector in piv_exp.index: formatos[("Exportaciones por Sector (MDD)", sector)] = "${:,.1f}"
+    df_exp = _data['export']
+    hist_exp = df_exp.pivot_table(index=['Sector', 'Estado_ID'], columns='Periodo', values='Valor', aggfunc='sum') / 1000
+    for sector in hist_exp.index.get_level_values('Sector').unique():
+        serie = hist_exp.xs(sector, level='Sector').reindex(ids).set_axis(nombres)
+        clave = ("Exportaciones", "Exportaciones (MDD)") if sector == 'Total' else ("Exportaciones por Sector (MDD)", sector)
+        tendencias[clave] = serie
+
+    # 4. Educación superior por nivel
+    edu = _data['edu_tot'].assign(ENTIDAD=_data['edu_tot']['ENTIDAD'].astype(str).str.strip().replace(NAME_NORMALIZER))
+    for col in ['Matrícula Total', 'Egresados Total']:
+        piv_edu = edu.assign(**{col: a_numero(edu[col])}).pivot_table(index='Nivel_Agrupado', columns='ENTIDAD', values=col, aggfunc='sum').reindex(columns=nombres)
+        piv_edu.index = [f"{col.split()[0]} {nivel}" for nivel in piv_edu.index]
+        bloques.append(pd.concat({"Educación por Nivel": piv_edu}))
+        for ind in piv_edu.index: formatos[("Educación por Nivel", ind)] = "{:,.0f}"
+
+    # 5. Remesas e IMSS: historia reciente para las mini-gráficas
+    df_rem = _data['remesas'].assign(fecha=pd.to_datetime(_data['remesas']['fecha'], errors='coerce'))
+    df_rem = df_rem.dropna(subset=['fecha', 'Total']).sort_values('fecha').rename(columns=NAME_NORMALIZER)
+    hist_rem = df_rem.set_index('fecha').reindex(columns=nombres).tail(20)
+    hist_rem.index = [f"{f.quarter}T {f.year}" for f in hist_rem.index]
+    tendencias[("Remesas", "Remesas Trimestrales (MDD)")] = hist_rem.T
+    imss = get_series_imss(_data, version)
+    tendencias[("Empleo Formal (IMSS)", "Puestos de Trabajo IMSS")] = imss['puestos'].tail(24).T
+    tendencias[("Empleo Formal (IMSS)", "Salario Diario IMSS")] = imss['salario'].tail(24).T
+
+    # 6. IMCO desagregado: el Rank del ETL ordena siempre de mayor a menor valor, así que las
+    # posiciones se calculan aquí con la orientación de TIPO_INDICADOR (inverso = menor es mejor)
+    df_imco = _data['imco_d'][~_data['imco_d']['Indicador'].isin(INDICADORES_IGNORADOS)]
+    df_imco = df_imco.assign(
+        Entidad_Norm=df_imco['Entidad'].str.strip().replace(NAME_NORMALIZER),
+        Indicador=df_imco['Indicador'].replace(CORRECCION_NOMBRES).astype(str).str.strip(),
+        Seccion="IMCO: " + df_imco['Subíndice'].astype(str).str.strip()
+    )
+    piv_imco = df_imco.pivot_table(index=['Seccion', 'Indicador'], columns='Entidad_Norm', values='Value', aggfunc='first').reindex(columns=nombres)
+    bloques.append(piv_imco)
+    for sec, ind in piv_imco.index: ascendente[(sec, ind)] = TIPO_INDICADOR.get(ind) == "Inverso"
+
+    valores = pd.concat(bloques)
+    valores = valores[~valores.index.duplicated()]
+    asc = np.array([ascendente.get(c, False) for c in valores.index])
+    # Posición 1 = mayor valor, salvo en indicadores donde menos es mejor
+    ranks = valores.mul(np.where(asc, 1, -1), axis=0).rank(axis=1, method='min')
+    # Control: la posición 1 de cada indicador tiene el mejor valor según su orientación
+    mejor = np.where(asc, valores.min(axis=1), valores.max(axis=1))
+    primero = valores.where(ranks == 1).max(axis=1).to_numpy()
+    invertidos = [f"{sec} / {ind}" for (sec, ind), m, p in zip(valores.index, mejor, primero) if not np.isnan(m) and m != p]
+    if invertidos: diag.contexto(rankings_invertidos=invertidos)
+
+    # Orden 1-32 resuelto de antemano (estados sin dato al final)
+    idx = np.argsort(np.nan_to_num(ranks.to_numpy(dtype=float), nan=np.inf), axis=1, kind='stable')
+    orden = pd.DataFrame(np.array(nombres)[idx], index=ranks.index, columns=range(1, len(nombres) + 1))
+
+    secciones = {}
+    for sec, ind in valores.index: secciones.setdefault(sec, []).append(ind)
+    return {
+        'valores': valores,
+        'ranks': ranks,
+        'orden': orden,
+        'secciones': secciones,
+        'formatos': formatos,
+        'tendencias': {k: v for k, v in tendencias.items() if v is not None}
+    }
+
+# Cálculo por estado (exportaciones, IMSS, educación, IMCO) en calculo_estatal.py. Cada sesión
+# de Streamlit es un hilo del mismo proceso, así que el trabajo de pandas de varias sesiones se
+# turna el GIL; con FICHA_WORKERS=N (N > 0) ese cálculo corre en un pool de N procesos y el hilo
+# de la sesión solo dibuja. Con 0 (por defecto) se calcula en el propio hilo. En ambos modos el
+# resultado se guarda por (estado, versión de datos) y lo comparten todas las sesiones.
+WORKERS_CALCULO = max(int(os.environ.get("FICHA_WORKERS", "0") or 0), 0)
+# Presupuesto de la caché por estado (entradas estado-versión): al llenarse, st.cache_resource
+# descarta la usada menos recientemente (LRU). FICHA_CACHE_ESTADOS lo ajusta.
+MAX_ESTADOS_CACHE = max(int(os.environ.get("FICHA_CACHE_ESTADOS", "") or 2 * len(STATE_MAP)), 1)
+CATALOGOS_CALCULO = {
+    'normalizador': NAME_NORMALIZER,
+    'ignorados': INDICADORES_IGNORADOS,
+    'correccion': CORRECCION_NOMBRES,
+    'tipos': TIPO_INDICADOR
+}
+
+def tablas_calculo(data):
+    return {nombre: data[nombre] for nombre in calc.TABLAS_CALCULO}
+
+def cerrar_pool(pool):
+    pool.shutdown(wait=False, cancel_futures=True)
+
+@st.cache_resource(max_entries=1, on_release=cerrar_pool)
+def get_pool_calculo(_data, version, workers):
+    # Un pool por versión de datos: cada trabajador recibe las tablas una sola vez al arrancar
+    # y el pool anterior se cierra al reemplazarse
+    return calc.crear_pool(workers, tablas_calculo(_data), CATALOGOS_CALCULO)
+
+@diag.instrumentar("get_calculo_estado", cache=True)
+@st.cache_resource(max_entries=MAX_ESTADOS_CACHE, show_spinner=False)
+def get_calculo_estado(_data, version, estado):
+    diag.marcar_calculo()
+    estado_norm = NAME_NORMALIZER.get(estado, estado)
+    args = (estado_norm, NAME_TO_ID.get(estado_norm))
+    if WORKERS_CALCULO > 0:
+        try:
+            return get_pool_calculo(_data, version, WORKERS_CALCULO).submit(calc.calcular_estado, *args).result()
+        except BrokenProcessPool:
+            get_pool_calculo.clear()  # un trabajador murió: el pool se recrea en la siguiente llamada
+    return calc.calcular_estado(*args, tablas_calculo(_data), CATALOGOS_CALCULO)
+
+# Precalentamiento: en la primera ejecución de la ficha tras arrancar el servidor, y cada vez que
+# cambia la versión de datos, un hilo de fondo calcula los resultados de los 32 estados, primero
+# los más visitados según las trazas del diagnóstico. El avance se escribe en
+# logs/precalentamiento.json y aparece en el panel de diagnóstico. FICHA_PRECALENTAR=0 lo apaga.
+PRECALENTAR = os.environ.get("FICHA_PRECALENTAR", "1").strip().lower() not in ("0", "false", "no")
+RUTA_PRECALENTAMIENTO = os.path.join("logs", "precalentamiento.json")
+
+def prioridad_estados(ruta=diag.RUTA_TRAZAS):
+    # Estados ordenados por visitas registradas; los que no aparecen conservan el orden del sidebar
+    visitas = dict.fromkeys(STATE_MAP.values(), 0)
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            for linea in f:
+                try: estado = json.loads(linea).get('estado')
+                except json.JSONDecodeError: continue
+                if estado in visitas: visitas[estado] += 1
+    except OSError:
+        pass
+    return sorted(visitas, key=lambda e: -visitas[e])
+
+class Precalentamiento:
+    """Hilo de fondo que llena la caché por estado de una versión de datos y reporta su avance."""
+
+    def __init__(self, data, version, estados):
+        self.version, self.estados = version, estados
+        self.hechos, self.errores = [], {}
+        self.actual = None
+        self.inicio, self.fin = time.time(), None
+        self.cancelado = threading.Event()
+        self.guardar()
+        self.hilo = threading.Thread(target=self.correr, args=(data,), name=f"precalentamiento-{version}", daemon=True)
+        self.hilo.start()
+
+    def correr(self, data):
+        # Un estado que ya abrió alguna sesión es un hit de caché; uno en cálculo por otra sesión
+        # espera su resultado en lugar de repetirlo (candado por llave de st.cache_resource)
+        for estado in self.estados:
+            if self.cancelado.is_set(): break
+            self.actual = estado
+            try: get_calculo_estado(data, self.version, estado)
+            except Exception as e: self.errores[estado] = f"{type(e).__name__}: {e}"
+            self.hechos.append(estado)
+            self.guardar()
+        self.actual, self.fin = None, time.time()
+        self.guardar()
+
+    def cancelar(self):
+        self.cancelado.set()
+
+    def avance(self):
+        return {
+            'version': self.version,
+            'inicio': datetime.fromtimestamp(self.inicio).isoformat(timespec='seconds'),
+            'segundos': round((self.fin or time.time()) - self.inicio, 2),
+            'total': len(self.estados),
+            'hechos': len(self.hechos),
+            'actual': self.actual,
+            'terminado': self.fin is not None,
+            'cancelado': self.cancelado.is_set(),
+            'errores': dict(self.errores),
+            'orden': self.estados
+        }
+
+    def guardar(self):
+        try:
+            os.makedirs(os.path.dirname(RUTA_PRECALENTAMIENTO), exist_ok=True)
+            temporal = f"{RUTA_PRECALENTAMIENTO}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as f: json.dump(self.avance(), f, ensure_ascii=False, indent=1)
+            os.replace(temporal, RUTA_PRECALENTAMIENTO)
+        except OSError:
+            pass  # el reporte de avance nunca debe detener el precalentamiento
+
+@st.cache_resource(max_entries=1, show_spinner=False, on_release=lambda p: p.cancelar())
+def get_precalentamiento(_data, version):
+    # Uno por versión de datos: al cambiar la versión se cancela el anterior y arranca el nuevo
+    # Con un presupuesto menor a 32 estados solo se precalientan los más visitados
+    return Precalentamiento(_data, version, prioridad_estados()[:MAX_ESTADOS_CACHE])
+
+# Prefetch predictivo: al terminar cada ficha, mientras el usuario la lee, un hilo de fondo
+# calcula los estados a los que es más probable que vaya después. La predicción combina las
+# transiciones de la propia sesión, las de todas las sesiones del servidor y, como punto de
+# partida, los estados contiguos en el sidebar y los pares más similares. Lo precalculado entra
+# a la misma caché por estado, acotada por MAX_ESTADOS_CACHE con desalojo LRU.
+# FICHA_PREFETCH=0 lo apaga.
+PREFETCH_ESTADOS = max(int(os.environ.get("FICHA_PREFETCH", "3") or 0), 0)  # estados por ejecución
+PREFETCH_MAX_PENDIENTES = 8  # tope de la cola de fondo: con más, las predicciones nuevas se descartan
+PESOS_PREDICCION = {'sesion': 0.5, 'global': 0.3, 'vecinos': 0.2}
+
+class Transiciones:
+    """Conteo de cambios de estado origen -> destino de todas las sesiones, y aciertos del prefetch."""
+
+    def __init__(self):
+        self.conteos = {}
+        self.aciertos, self.intentos = 0, 0
+        self.candado = threading.Lock()
+
+    def registrar(self, origen, destino, predichos):
+        with self.candado:
+            self.conteos.setdefault(origen, Counter())[destino] += 1
+            if predichos:
+                self.intentos += 1
+                self.aciertos += destino in predichos
+
+    def desde(self, origen):
+        with self.candado:
+            return Counter(self.conteos.get(origen, {}))
+
+class Prefetch:
+    """Un hilo de fondo que calcula los estados predichos, sin repetir los que ya están en cola."""
+
+    def __init__(self):
+        self.hilo = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.pendientes = set()
+        self.solicitados = 0
+        self.candado = threading.Lock()
+
+    def pedir(self, data, version, estados):
+        for estado in estados:
+            with self.candado:
+                if (estado, version) in self.pendientes or len(self.pendientes) >= PREFETCH_MAX_PENDIENTES: continue
+                self.pendientes.add((estado, version))
+                self.solicitados += 1
+            self.hilo.submit(self.calcular, data, version, estado)
+
+    def calcular(self, data, version, estado):
+        # Hit si el estado ya está en caché; si otra sesión lo está calculando, espera ese resultado
+        try: get_calculo_estado(data, version, estado)
+        except Exception: pass  # la sesión que abra el estado verá el error en su propia ejecución
+        finally:
+            with self.candado: self.pendientes.discard((estado, version))
+
+@st.cache_resource
+def get_transiciones():
+    return Transiciones()
+
+@st.cache_resource
+def get_prefetch():
+    return Prefetch()
+
+def vecinos_estado(estado, sim_data, k=2):
+    # Punto de partida sin historial: contiguos en el sidebar y los k pares más similares
+    ids = [NAME_TO_ID[estado] + d for d in (1, -1)]
+    vecinos = [STATE_MAP[i] for i in ids if i in STATE_MAP]
+    vecinos += [p['Estado'] for p in get_similar_states(sim_data, NAME_TO_ID[estado], k=k)]
+    return list(dict.fromkeys(v for v in vecinos if v != estado))
+
+def predecir_siguientes(estado, transiciones_sesion, transiciones_global, vecinos, k):
+    # Mezcla de probabilidades de transición; cada fuente se normaliza por su propio total
+    puntaje = Counter()
+    fuentes = {
+        'sesion': transiciones_sesion.get(estado, Counter()),
+        'global': transiciones_global,
+        'vecinos': Counter(dict.fromkeys(vecinos, 1))
+    }
+    for fuente, conteo in fuentes.items():
+        total = sum(conteo.values())
+        for destino, n in conteo.items(): puntaje[destino] += PESOS_PREDICCION[fuente] * n / total
+    puntaje.pop(estado, None)
+    return [e for e, _ in puntaje.most_common(k)]
+
+def get_rank_nacional(clave, estado):
+    # Posición nacional y Top 1 de un indicador, leídos de la matriz precalculada
+    ranks = RANKINGS['ranks']
+    if clave not in ranks.index or estado not in ranks.columns: return 0, "-"
+    rk = ranks.at[clave, estado]
+    return (int(rk) if pd.notna(rk) else 0), RANKINGS['orden'].at[clave, 1]
+
 def mostrar_fecha_act(llave_fecha, align="right", m_top="5px", m_bottom="-15px"):
     fecha = DATA.get('fechas', {}).get(llave_fecha, "Fecha no disponible")
     
@@ -481,6 +1277,46 @@ def mostrar_fecha_act(llave_fecha, align="right", m_top="5px", m_bottom="-15px")
         
     st.markdown(f"<div style='text-align: {align}; color: #94A3B8; font-size: 0.75rem; margin-top: {m_top}; margin-bottom: {m_bottom};'><i>{texto_mostrar}</i></div>", unsafe_allow_html=True)
 
+@st.cache_resource(max_entries=2)
+def get_verificacion(version):
+    # Marca del proceso por versión de datos, fuera del almacén para no escribir en él
+    return {'hecha': False}
+
+def mostrar_diagnostico():
+    # Cierra la traza de la ejecución y, si el diagnóstico está activo, muestra el panel. Las tablas
+    # compartidas se verifican en cada ejecución con diagnóstico y, sin él, en la primera ejecución
+    # de cada versión de datos
+    modificadas = []
+    verificacion = get_verificacion(DATA_VERSION)
+    if DATA is not None and (diag.activo() or not verificacion['hecha']):
+        modificadas = verificar_datos(DATA)
+        verificacion['hecha'] = True
+    if modificadas:
+        st.error(f"Se modificaron tablas compartidas durante la ejecución: {', '.join(modificadas)}")
+    if diag.activo() and PRECALENTAMIENTO is not None:
+        avance = PRECALENTAMIENTO.avance()
+        diag.contexto(precalentamiento=f"{avance['hechos']}/{avance['total']}")
+    registro = diag.finalizar()
+    if registro is None: return
+    st.markdown("<hr style='border-color: #E2E8F0;'>", unsafe_allow_html=True)
+    with st.expander(f"🔧 Diagnóstico de la ejecución: {registro['ms_total']:,.0f} ms", expanded=False):
+        df_diag = pd.DataFrame(registro['spans']).sort_values('ms_total', ascending=False)
+        st.dataframe(df_diag, hide_index=True, use_container_width=True)
+        st.caption(f"Secciones, funciones auxiliares (con hits/misses de caché y filas recorridas), vistas de las tablas compartidas (copia) y serialización de figuras y tablas. Traza agregada a {diag.RUTA_TRAZAS}.")
+        df_mem = pd.DataFrame(DATA.get('memoria', []))
+        if not df_mem.empty:
+            df_mem['reduccion_%'] = ((1 - df_mem['kb_despues'] / df_mem['kb_antes']) * 100).round(1)
+            st.dataframe(df_mem, hide_index=True, use_container_width=True)
+            st.caption(f"Memoria de los insumos tipados: {df_mem['kb_despues'].sum():,.0f} KB (antes {df_mem['kb_antes'].sum():,.0f} KB).")
+        transiciones = get_transiciones()
+        if transiciones.intentos:
+            st.caption(f"Prefetch: {st.session_state.get('prefetch_predichos', [])} para la siguiente selección; acertó {transiciones.aciertos} de {transiciones.intentos} cambios de estado ({transiciones.aciertos / transiciones.intentos * 100:.0f}%), {get_prefetch().solicitados} estados solicitados.")
+        if PRECALENTAMIENTO is not None:
+            avance = PRECALENTAMIENTO.avance()
+            estado_txt = "terminado" if avance['terminado'] else f"calculando {avance['actual']}"
+            errores_txt = f", {len(avance['errores'])} con error" if avance['errores'] else ""
+            st.caption(f"Precalentamiento de la versión {avance['version']}: {avance['hechos']}/{avance['total']} estados en {avance['segundos']:,.1f}s ({estado_txt}{errores_txt}).")
+
 def render_custom_metric(label, value, sub_text, color="#0F172A"):
     st.markdown(f"""
     <div class="card-hover" style="background-color: #ffffff; border: 1px solid #E2E8F0; padding: 18px; border-radius: 12px; margin-bottom: 12px; height: 100%; box-shadow: 0 4px 6px rgba(0,0,0,0.02);">
@@ -490,9 +1326,135 @@ def render_custom_metric(label, value, sub_text, color="#0F172A"):
     </div>
     """, unsafe_allow_html=True)
 
+# Posiciones nacionales de todos los indicadores: alimentan las tarjetas y la vista de ranking
+diag.seccion("Matrices nacionales")
+RANKINGS = get_rank_matrix(DATA, DATA_VERSION)
+PRECALENTAMIENTO = get_precalentamiento(DATA, DATA_VERSION) if PRECALENTAR else None
+
+# Transiciones entre estados: alimentan la predicción del prefetch al final de la ficha
+estado_previo = st.session_state.get('estado_previo')
+if estado_previo and estado_previo != selected_name:
+    transiciones_sesion = st.session_state.setdefault('transiciones', {})
+    transiciones_sesion.setdefault(estado_previo, Counter())[selected_name] += 1
+    get_transiciones().registrar(estado_previo, selected_name, st.session_state.get('prefetch_predichos', []))
+st.session_state['estado_previo'] = selected_name
+
+# ==========================================
+# VISTA COMPARATIVA (2 A 6 ESTADOS)
+# ==========================================
+MAX_ESTADOS_COMPARACION = 6
+
+@st.fragment
+def render_comparacion(matriz, estados_default):
+    seleccion = st.multiselect(
+        "Estados a comparar", list(STATE_MAP.values()), default=estados_default,
+        max_selections=MAX_ESTADOS_COMPARACION, key="comparacion_estados"
+    )
+    if len(seleccion) < 2:
+        st.info("Selecciona al menos 2 estados para compararlos.")
+        return
+
+    # Cada estado agregado es solo una columna más de la matriz precalculada
+    sub = matriz[seleccion]
+    ancho_col = f"{72 / len(seleccion):.2f}%"
+    encabezado = "".join(f"<div style='flex: 0 0 {ancho_col}; text-align: center;'>{e}</div>" for e in seleccion)
+
+    seccion_actual = None
+    html = ""
+    for seccion, indicador, fmt, mejor in METRICAS_COMPARACION:
+        if seccion != seccion_actual:
+            if html: html += "</div>"
+            html += f"""<h4 style='color: #2596be; margin-top: 25px; margin-bottom: 10px;'>{seccion}</h4>
+<div style="border: 1px solid #E2E8F0; border-radius: 12px; overflow: hidden; background-color: white; box-shadow: 0 4px 6px rgba(0,0,0,0.02);">
+<div style="display: flex; background-color: #F8FAFC; padding: 10px 15px; font-size: 0.75rem; font-weight: 700; color: #64748B; text-transform: uppercase; border-bottom: 1px solid #E2E8F0;">
+<div style="flex: 0 0 28%;">Indicador</div>{encabezado}</div>"""
+            seccion_actual = seccion
+
+        fila = sub.loc[indicador] if indicador in sub.index else pd.Series(np.nan, index=seleccion)
+        objetivo = None
+        if mejor and fila.notna().sum() > 1:
+            objetivo = fila.max() if mejor == "max" else fila.min()
+
+        celdas = ""
+        for estado in seleccion:
+            v = fila[estado]
+            if pd.isna(v):
+                celdas += f"<div style='flex: 0 0 {ancho_col}; text-align: center; color: #CBD5E1;'>-</div>"
+            elif objetivo is not None and v == objetivo:
+                celdas += f"<div style='flex: 0 0 {ancho_col}; text-align: center; color: #059669; font-weight: 800;'>{fmt.format(v)} ★</div>"
+            else:
+                celdas += f"<div style='flex: 0 0 {ancho_col}; text-align: center; color: #0F172A; font-weight: 600;'>{fmt.format(v)}</div>"
+        html += f"""<div style="display: flex; padding: 10px 15px; font-size: 0.9rem; border-bottom: 1px solid #F1F5F9; align-items: center;">
+<div style="flex: 0 0 28%; color: #475569;">{indicador}</div>{celdas}</div>"""
+    html += "</div>"
+    st.markdown(html, unsafe_allow_html=True)
+    st.caption("★ Mejor valor entre los estados seleccionados (mayor o menor según el indicador). Periodos iguales a los de la ficha estatal de cada sección.")
+
+if vista == "Comparar estados":
+    diag.seccion("Vista comparativa")
+    st.markdown("<h1 style='color: #2596be; font-size: 2.8rem;'>Comparativo Estatal</h1>", unsafe_allow_html=True)
+    st.markdown("<p style='text-align: left; color: #94A3B8; font-size: 0.85rem; margin-top: -10px;'><i>MDP: Millones de Pesos &nbsp;|&nbsp; MDD: Millones de Dólares</i></p>", unsafe_allow_html=True)
+    # Por defecto: el estado seleccionado y sus dos pares más parecidos
+    pares = get_similar_states(get_similarity_matrix(DATA, DATA_VERSION), state_id, k=2)
+    render_comparacion(get_metric_matrix(DATA, DATA_VERSION), [selected_name] + [p['Estado'] for p in pares])
+    mostrar_diagnostico()
+    st.stop()
+
+# ==========================================
+# VISTA DE RANKING NACIONAL
+# ==========================================
+@st.fragment
+def render_ranking(rankings, estado_resaltado):
+    c_sec, c_ind = st.columns([1, 2])
+    with c_sec: seccion = st.selectbox("Sección", list(rankings['secciones'].keys()), key="ranking_seccion")
+    with c_ind: indicador = st.selectbox("Indicador", rankings['secciones'][seccion], key="ranking_indicador")
+    clave = (seccion, indicador)
+
+    # Todo sale de la matriz: orden, posiciones y valores ya calculados para los 32 estados
+    estados = rankings['orden'].loc[clave].tolist()
+    ranks = rankings['ranks'].loc[clave, estados]
+    vals = rankings['valores'].loc[clave, estados]
+    fmt = rankings['formatos'].get(clave, "{:,.2f}")
+
+    rk_est = ranks.get(estado_resaltado)
+    if pd.notna(rk_est):
+        r1, r2, r3 = st.columns(3)
+        with r1: render_custom_metric(f"Posición de {estado_resaltado}", f"#{int(rk_est)}", f"de {int(ranks.notna().sum())} entidades con dato")
+        with r2: render_custom_metric("Valor", fmt.format(vals[estado_resaltado]), indicador)
+        with r3: render_custom_metric("1er Lugar", estados[0], fmt.format(vals.iloc[0]))
+
+    tabla = pd.DataFrame({
+        'Posición': [f"#{int(r)}" if pd.notna(r) else "-" for r in ranks],
+        'Estado': estados,
+        'Valor': [fmt.format(v) if pd.notna(v) else "-" for v in vals],
+    })
+    column_config = {}
+    hist = rankings['tendencias'].get(clave)
+    if hist is not None:
+        tabla['Tendencia'] = [[float(x) for x in fila if pd.notna(x)] for fila in hist.reindex(estados).to_numpy()]
+        column_config['Tendencia'] = st.column_config.LineChartColumn(f"Tendencia ({hist.columns[0]} - {hist.columns[-1]})", width="medium")
+
+    resaltar = lambda fila: ['background-color: #E0F2FE; font-weight: 700;' if fila['Estado'] == estado_resaltado else '' for _ in fila]
+    st.dataframe(tabla.style.apply(resaltar, axis=1), hide_index=True, use_container_width=True, height=35 * (len(tabla) + 1) + 3, column_config=column_config)
+    st.caption("ℹ️ Posición 1 = mayor valor, salvo en indicadores donde un valor menor es mejor (desocupación, informalidad, concentración exportadora). En IMCO, menor es mejor en los indicadores inversos (homicidios, informalidad, ...).")
+
+if vista == "Ranking nacional":
+    diag.seccion("Vista de ranking")
+    st.markdown("<h1 style='color: #2596be; font-size: 2.8rem;'>Ranking Nacional por Indicador</h1>", unsafe_allow_html=True)
+    st.markdown("<p style='text-align: left; color: #94A3B8; font-size: 0.85rem; margin-top: -10px;'><i>MDP: Millones de Pesos &nbsp;|&nbsp; MDD: Millones de Dólares</i></p>", unsafe_allow_html=True)
+    render_ranking(RANKINGS, selected_name)
+    mostrar_diagnostico()
+    st.stop()
+
+# Resultados por estado que consumen las secciones (solo lectura: se comparten entre sesiones)
+diag.seccion("Cálculo estatal")
+diag.contexto(workers_calculo=WORKERS_CALCULO)
+CALCULO = get_calculo_estado(DATA, DATA_VERSION, selected_name)
+
 # ==========================================
 # SECCIÓN 1: RESUMEN EJECUTIVO
 # ==========================================
+diag.seccion("1. Resumen Ejecutivo")
 st.markdown("<hr style='border-color: #2596be; margin-top: 5px; border-width: 2px;'>", unsafe_allow_html=True)
 st.header("1. Resumen Ejecutivo")
 st.markdown("<div style='font-size: 0.8rem; color: #94A3B8; margin-top: -15px; margin-bottom: 20px;'>Fuente: PIB por Entidad Federativa (INEGI), Exportaciones por Entidad Federativa (INEGI) e Inversión Extranjera Directa (Secretaría de Economía)</div>", unsafe_allow_html=True)
@@ -513,7 +1475,7 @@ with col2:
     else: st.warning("Sin datos Manufactura")
 
 with col3:
-    res = get_export_metrics(DATA['export'], state_id_str)
+    res = get_export_metrics(DATA['export'], state_id)
     if res:
         v, p, g, gn, r, t1, trim_str = res
         render_card(f"Exportaciones ({trim_str})", format_mm_usd(v), r, t1, p, g, gn, DATA.get('fechas', {}).get('exportaciones', ''))
@@ -529,6 +1491,7 @@ with col4:
 # ==========================================
 # SECCIÓN 2: ESTRUCTURA ECONÓMICA
 # ==========================================
+diag.seccion("2. Estructura Económica")
 st.markdown("<hr style='border-color: #E2E8F0; margin-top: 0px;'>", unsafe_allow_html=True)
 
 df_pib = DATA['pib']
@@ -537,25 +1500,8 @@ max_period = df_pib['Periodo'].max()
 st.header(f"2. Estructura Económica (PIB {max_period})")
 st.markdown("<div style='font-size: 0.8rem; color: #94A3B8; margin-top: -15px; margin-bottom: 20px;'>Fuente: PIB por Entidad Federativa (INEGI)</div>", unsafe_allow_html=True)
 
-df_curr = df_pib[(df_pib['Estado_ID'] == state_id) & (df_pib['Periodo'] == max_period)].copy()
-df_nac = df_pib[(df_pib['Estado_ID'] == 0) & (df_pib['Periodo'] == max_period)].copy()
-
-HIERARCHY = {
-    "Primario": {
-        "Total": "Actividades Primarias",
-        "Subsectores": ["Agricultura, cría y explotación de animales, aprovechamiento forestal, pesca y caza"],
-        "Actividades": ["Agricultura", "Cría y explotación de animales", "Pesca, caza y captura", "Aprovechamiento forestal"]
-    },
-    "Secundario": {
-        "Total": "Actividades Secundarias",
-        "Subsectores": ["Minería", "Generación, transmisión y distribución de energía eléctrica, agua y gas", "Construcción", "Industrias manufactureras"],
-        "Manufactura_Actividades": ["Industria alimentaria", "Bebidas y tabaco", "Insumos, acabados y productos textiles", "Prendas de vestir y productos de cuero y piel", "Industria de la madera", "Industria del papel", "Productos derivados del petróleo y carbón, química, plástico y hule", "Productos a base de minerales no metálicos", "Metálicas básicas y productos metálicos", "Maquinaria y equipo, computación, electrónicos y accesorios", "Muebles, colchones y persianas", "Otras industrias manufactureras"]
-    },
-    "Terciario": {
-        "Total": "Actividades Terciarias",
-        "Subsectores": ["Comercio al por mayor", "Comercio al por menor", "Transportes, correos y almacenamiento", "Información en medios masivos", "Servicios financieros y de seguros", "Servicios inmobiliarios y de alquiler de bienes", "Servicios profesionales, científicos y técnicos", "Corporativos", "Servicios de apoyo a los negocios y manejo de residuos", "Servicios educativos", "Servicios de salud y de asistencia social", "Servicios de esparcimiento culturales y deportivos", "Servicios de alojamiento temporal y de preparación de alimentos y bebidas", "Otros servicios excepto actividades gubernamentales", "Actividades legislativas, gubernamentales"]
-    }
-}
+df_curr = df_pib[(df_pib['Estado_ID'] == state_id) & (df_pib['Periodo'] == max_period)]
+df_nac = df_pib[(df_pib['Estado_ID'] == 0) & (df_pib['Periodo'] == max_period)]
 
 def get_val(df, indicador_name):
     row = df[df['Indicador'] == indicador_name]
@@ -586,21 +1532,15 @@ tot_emp = 0
 if not df_enoe_est.empty:
     tot_emp = (df_enoe_est['Sector Primario'] + df_enoe_est['Sector Secundario'] + df_enoe_est['Sector Terciario'] + df_enoe_est['No especificado']).values[0]
 
+@diag.instrumentar()
 def render_sector_col(col, meta_key, color_hex, df_curr, df_nac, pib_estatal_total, tot_emp, df_enoe_est, enoe_key, df_full_pib, state_id, max_period):
+    diag.filas(len(df_curr) + len(df_nac))
     meta = HIERARCHY[meta_key]
     val_est = get_val(df_curr, meta["Total"])
     val_nac_total_sector = get_val(df_nac, meta["Total"])
     
-    # --- CÁLCULO DE RANKING DEL SECTOR ---
-    df_rank = df_full_pib[(df_full_pib['Indicador'] == meta["Total"]) & (df_full_pib['Periodo'] == max_period) & (df_full_pib['Estado_ID'] != 0)].copy()
-    df_rank['Rank'] = df_rank['Valor'].rank(ascending=False)
-    try:
-        rk_sector = int(df_rank[df_rank['Estado_ID'] == state_id]['Rank'].values[0])
-        top1_id = df_rank[df_rank['Rank'] == 1].iloc[0]['Estado_ID']
-        top1_name = STATE_MAP.get(top1_id, "N/A")
-    except:
-        rk_sector = 0
-        top1_name = "-"
+    # --- RANKING DEL SECTOR (matriz nacional precalculada) ---
+    rk_sector, top1_name = get_rank_nacional(("PIB por Actividad (MDP)", meta["Total"]), STATE_MAP.get(state_id))
 
     part_nac = (val_est / val_nac_total_sector * 100) if val_nac_total_sector > 0 else 0
     part_estatal = (val_est / pib_estatal_total * 100) if pib_estatal_total > 0 else 0
@@ -656,82 +1596,44 @@ mostrar_fecha_act('pib')
 # ==========================================
 # SECCIÓN 3: TOP EXPORTACIONES
 # ==========================================
+diag.seccion("3. Exportaciones")
 st.markdown("<hr style='border-color: #E2E8F0;'>", unsafe_allow_html=True)
 
 # 1. Calculamos max_y ANTES de imprimir el título
-df_e = DATA['export'].copy()
-df_e['Year'] = df_e['Periodo'].astype(str).str[:4].astype(int)
-df_e['Quarter'] = df_e['Periodo'].astype(str).str[-2:]
-max_y = df_e['Year'].max()
-quarters_avail = df_e[df_e['Year'] == max_y]['Quarter'].unique()
+exportaciones = CALCULO['exportaciones']
+max_y = exportaciones['max_y']
 
 # 2. Inyectamos el rango de años SOLO en este título
 st.header(f"3. Principales Sectores de Exportación")
 st.markdown("<div style='font-size: 0.8rem; color: #94A3B8; margin-top: -15px; margin-bottom: 20px;'>Fuente: Exportaciones por Entidad Federativa INEGI</div>", unsafe_allow_html=True)
 
-# 3. Continúa tu código normal...
-st_e_curr = df_e[(df_e['Estado_ID'].astype(str).str.zfill(2) == state_id_str) & (df_e['Year'] == max_y) & (df_e['Sector'] != 'Total')]
-st_e_prev = df_e[(df_e['Estado_ID'].astype(str).str.zfill(2) == state_id_str) & (df_e['Year'] == (max_y - 1)) & (df_e['Quarter'].isin(quarters_avail)) & (df_e['Sector'] != 'Total')]
+# 3. Top 10 de sectores (>= 500 en el año) ya agregado por calculo_estatal
+if exportaciones['top10'] is not None:
+    rks = [get_rank_nacional(("Exportaciones por Sector (MDD)", s), selected_name)[0] for s in exportaciones['top10']['Sector']]
+    top10 = exportaciones['top10'].assign(**{'Rank Nac': [rk if rk else "-" for rk in rks]})
 
-if not st_e_curr.empty:
-    # 1. Agrupamos todos los sectores disponibles
-    top_all = st_e_curr.groupby('Sector')['Valor'].sum().reset_index().sort_values('Valor', ascending=False)
+    max_val_scale = max(top10['Valor'].max(), top10['Valor_Prev'].max())
+    q_len = exportaciones['trimestres']
     
-    # 2. NUEVO FILTRO: Omitir si el valor bruto es menor a 500
-    top_all = top_all[top_all['Valor'] >= 500]
+    # Lógica de etiquetas de periodo
+    if q_len == 4:
+        label_curr = str(max_y)
+        label_prev = str(max_y - 1)
+    else:
+        q_prefix = f"1T-{q_len}T" if q_len > 1 else "1T"
+        label_curr = f"{q_prefix} {max_y}"
+        label_prev = f"{q_prefix} {max_y - 1}"
+
+    # --- TOTALES POR AÑO ---
+    val_total_curr, val_total_prev = exportaciones['total_curr'], exportaciones['total_prev']
     
-    # 3. Extraemos el Top 10 después de haber limpiado los ceros
-    top10 = top_all.head(10)
+    # --- NUEVA LÓGICA DE ESCALA PARA BARRAS TOTALES ---
+    max_total_scale = max(val_total_curr, val_total_prev)
+    pct_total_prev = max((val_total_prev / max_total_scale) * 85 if max_total_scale > 0 else 0, 0.5)
+    pct_total_curr = max((val_total_curr / max_total_scale) * 85 if max_total_scale > 0 else 0, 0.5)
     
-    # Verificamos que tras el filtro sigan existiendo datos
-    if not top10.empty:
-        tot_curr = top10['Valor'].sum()
-        top10['Part'] = (top10['Valor']/tot_curr*100) if tot_curr > 0 else 0
-        
-        if not st_e_prev.empty:
-            prev_agg = st_e_prev.groupby('Sector')['Valor'].sum().reset_index().rename(columns={'Valor': 'Valor_Prev'})
-            top10 = top10.merge(prev_agg, on='Sector', how='left')
-        else: top10['Valor_Prev'] = 0
-        top10['Valor_Prev'] = top10['Valor_Prev'].fillna(0)
-        
-        nac_curr_agg = df_e[(df_e['Year'] == max_y) & (df_e['Sector'] != 'Total')].groupby(['Sector', 'Estado_ID'])['Valor'].sum().reset_index()
-        rks = []
-        for s in top10['Sector']:
-            d_s = nac_curr_agg[nac_curr_agg['Sector'] == s].copy()
-            d_s['Rank'] = d_s['Valor'].rank(ascending=False)
-            try: rks.append(int(d_s[d_s['Estado_ID'].astype(str).str.zfill(2) == state_id_str]['Rank'].values[0]))
-            except: rks.append("-")
-        top10['Rank Nac'] = rks
-
-        max_val_scale = max(top10['Valor'].max(), top10['Valor_Prev'].max())
-        q_len = len(quarters_avail)
-        
-        # Lógica de etiquetas de periodo
-        if q_len == 4:
-            label_curr = str(max_y)
-            label_prev = str(max_y - 1)
-        else:
-            q_prefix = f"1T-{q_len}T" if q_len > 1 else "1T"
-            label_curr = f"{q_prefix} {max_y}"
-            label_prev = f"{q_prefix} {max_y - 1}"
-
-        # --- CÁLCULO DE TOTALES POR AÑO ---
-        val_total_curr = df_e[(df_e['Estado_ID'].astype(str).str.zfill(2) == state_id_str) & 
-                              (df_e['Year'] == max_y) & 
-                              (df_e['Sector'] == 'Total')]['Valor'].sum()
-
-        val_total_prev = df_e[(df_e['Estado_ID'].astype(str).str.zfill(2) == state_id_str) & 
-                              (df_e['Year'] == (max_y - 1)) & 
-                              (df_e['Quarter'].isin(quarters_avail)) & 
-                              (df_e['Sector'] == 'Total')]['Valor'].sum()
-        
-        # --- NUEVA LÓGICA DE ESCALA PARA BARRAS TOTALES ---
-        max_total_scale = max(val_total_curr, val_total_prev)
-        pct_total_prev = max((val_total_prev / max_total_scale) * 85 if max_total_scale > 0 else 0, 0.5)
-        pct_total_curr = max((val_total_curr / max_total_scale) * 85 if max_total_scale > 0 else 0, 0.5)
-        
-        # --- ESTRUCTURA HTML DE LA TARJETA ---
-        html_export = f"""<div style="background-color: white; padding:25px; border-radius:12px; border:1px solid #E2E8F0; box-shadow: 0 4px 15px rgba(0,0,0,0.03); width: 100%; font-family: sans-serif; color: #334155;">
+    # --- ESTRUCTURA HTML DE LA TARJETA ---
+    html_export = f"""<div style="background-color: white; padding:25px; border-radius:12px; border:1px solid #E2E8F0; box-shadow: 0 4px 15px rgba(0,0,0,0.03); width: 100%; font-family: sans-serif; color: #334155;">
 
 <div style="margin-bottom:25px; border-bottom: 2px solid #F1F5F9; padding-bottom: 20px;">
     <div style="display: flex; align-items: center; margin-bottom: 12px;">
@@ -758,15 +1660,15 @@ if not st_e_curr.empty:
 <div style="flex: 0 0 12%;">% Estatal</div>
 <div style="flex: 0 0 12%;">Rank Nacional</div>
 </div>"""
+    
+    # --- BARRAS (Proporcionales, con números pegados a la barra) ---
+    for _, r in top10.iterrows():
+        # Escalamos al 80% máximo para asegurar que haya espacio para el número al final
+        pct_curr = max((r['Valor'] / max_val_scale) * 85 if max_val_scale > 0 else 0, 0.5)
+        pct_prev = max((r['Valor_Prev'] / max_val_scale) * 85 if max_val_scale > 0 else 0, 0.5)
+        sector_wrapped = '<br>'.join(textwrap.wrap(r['Sector'], width=38))
         
-        # --- BARRAS (Proporcionales, con números pegados a la barra) ---
-        for _, r in top10.iterrows():
-            # Escalamos al 80% máximo para asegurar que haya espacio para el número al final
-            pct_curr = max((r['Valor'] / max_val_scale) * 85 if max_val_scale > 0 else 0, 0.5)
-            pct_prev = max((r['Valor_Prev'] / max_val_scale) * 85 if max_val_scale > 0 else 0, 0.5)
-            sector_wrapped = '<br>'.join(textwrap.wrap(r['Sector'], width=38))
-            
-            html_export += f"""<div style="display: flex; width: 100%; align-items: stretch; margin-bottom: 18px; justify-content: space-between; gap: 15px;">
+        html_export += f"""<div style="display: flex; width: 100%; align-items: stretch; margin-bottom: 18px; justify-content: space-between; gap: 15px;">
 <div style="flex: 0 0 25%; text-align: left; padding-left: 5px; font-size: 0.85rem; display: flex; align-items: center; justify-content: flex-start;">
 <span style="display: inline-block; line-height: 1.3; color: #0F172A; font-weight: 600;">{sector_wrapped}</span>
 </div>
@@ -794,15 +1696,32 @@ if not st_e_curr.empty:
 </div>
 </div>
 </div>"""
-            
-        html_export += "</div>"
-        st.markdown(html_export, unsafe_allow_html=True)
+        
+    html_export += "</div>"
+    st.markdown(html_export, unsafe_allow_html=True)
+
+    # --- DIVERSIFICACIÓN EXPORTADORA (matriz precalculada de los 32 estados) ---
+    df_div, max_y_div = get_export_diversification(DATA, DATA_VERSION)
+    if (max_y_div, state_id) in df_div.index:
+        d_curr = df_div.loc[(max_y_div, state_id)]
+        d_prev = df_div.loc[(max_y_div - 1, state_id)] if (max_y_div - 1, state_id) in df_div.index else None
+
+        def texto_prev(col, fmt):
+            return f"{label_prev}: {fmt.format(d_prev[col])}" if d_prev is not None else f"{label_prev}: -"
+
+        st.markdown(f"<h4 style='color:#0F172A; font-weight:800; margin-top: 25px;'>Diversificación Exportadora ({label_curr})</h4>", unsafe_allow_html=True)
+        dc1, dc2, dc3 = st.columns(3)
+        with dc1: render_custom_metric("Índice HHI", f"{d_curr['HHI']:,.0f}", f"Rank Nacional: #{int(d_curr['Rank_HHI'])} &nbsp;|&nbsp; {texto_prev('HHI', '{:,.0f}')}")
+        with dc2: render_custom_metric("Part. Top 3 Sectores", f"{d_curr['Top3']:.1f}%", f"Rank Nacional: #{int(d_curr['Rank_Top3'])} &nbsp;|&nbsp; {texto_prev('Top3', '{:.1f}%')}")
+        with dc3: render_custom_metric("Entropía Normalizada", f"{d_curr['Entropia']:.2f}", f"Rank Nacional: #{int(d_curr['Rank_Entropia'])} &nbsp;|&nbsp; {texto_prev('Entropia', '{:.2f}')}")
+        st.caption(f"ℹ️ Rank 1 = canasta exportadora más diversificada. HHI de 0 a 10,000 (mayor = más concentrada); entropía de 0 a 1 (mayor = más diversificada). Calculado sobre {int(d_curr['Sectores'])} sectores con exportaciones.")
 
 mostrar_fecha_act('exportaciones', m_top="20px", m_bottom="-10px")
 
 # ==========================================
 # SECCIÓN 4: DETALLE IED
 # ==========================================
+diag.seccion("4. IED")
 st.markdown("<hr style='border-color: #E2E8F0;'>", unsafe_allow_html=True)
 try:
     max_anio = int(DATA['ied_tot']['Anio'].max())
@@ -1012,9 +1931,10 @@ mostrar_fecha_act('ied')
 # ==========================================
 # SECCIÓN 5: REMESAS
 # ==========================================
+diag.seccion("5. Remesas")
 st.markdown("<hr style='border-color: #E2E8F0;'>", unsafe_allow_html=True)
 
-df_rem = DATA['remesas'].copy()
+df_rem = copia_local(DATA['remesas'], 'remesas')
 
 # Procesamiento de fechas y limpieza
 df_rem['fecha'] = pd.to_datetime(df_rem['fecha'], errors='coerce')
@@ -1050,10 +1970,7 @@ if estado_remesas in df_rem.columns:
         part_nac = (val_curr / nac_curr * 100) if nac_curr > 0 else 0
         
         # Ranking
-        estados_cols = [c for c in df_rem.columns if c not in ['fecha', 'Year', 'Quarter', 'Total']]
-        last_row_rem = df_rem.iloc[-1][estados_cols].fillna(0)
-        rk_rem = int(last_row_rem.rank(ascending=False, method='min')[estado_remesas])
-        top1_rem = last_row_rem.idxmax()
+        rk_rem, top1_rem = get_rank_nacional(("Remesas", "Remesas Trimestrales (MDD)"), selected_name)
 
         col_rem1, col_rem2 = st.columns([1, 2])
 
@@ -1095,7 +2012,7 @@ if estado_remesas in df_rem.columns:
 
         with col_rem2:
             # Seleccionamos exactamente los últimos 40 trimestres (10 años) para el gráfico
-            df_plot = df_rem.tail(40).copy()
+            df_plot = df_rem.tail(40)
             
             # Extraemos los periodos exactos de inicio y fin de la selección
             start_q = df_plot.iloc[0]['Quarter']
@@ -1159,6 +2076,7 @@ else:
 # ==========================================
 # SECCIÓN 6: RATINGS
 # ==========================================
+diag.seccion("6. Finanzas Públicas")
 if "Tlaxcala" not in selected_name:
     st.markdown("<hr style='border-color: #E2E8F0; margin-top: -20px;'>", unsafe_allow_html=True)
     
@@ -1170,7 +2088,7 @@ if "Tlaxcala" not in selected_name:
     if not df_r.empty:
         col_ent = [c for c in df_r.columns if "Entidad" in c][0]
         # Filtramos primero para obtener los datos del estado
-        match = df_r[df_r[col_ent].astype(str).apply(lambda x: NAME_NORMALIZER.get(x, x)) == state_norm].copy()
+        match = df_r[df_r[col_ent].astype(str).apply(lambda x: NAME_NORMALIZER.get(x, x)) == state_norm]
         
         if not match.empty:
             # Estandarizamos el nombre de la columna de fecha para extraer el año
@@ -1225,6 +2143,7 @@ if "Tlaxcala" not in selected_name:
 # ==========================================
 # SECCIÓN 7: POBLACIÓN
 # ==========================================
+diag.seccion("7. Demografía y Mercado Laboral")
 offset = 1 if "Tlaxcala" in selected_name else 0
 
 if "Tlaxcala" in selected_name:
@@ -1295,7 +2214,7 @@ elif df_enoe_nac.empty: st.warning("No se encontró el registro 'Nacional' en EN
 
 with col_chart:
     df_pob = DATA['pob']
-    df_st = df_pob[df_pob['Estado_ID'].astype(int) == state_id].copy()
+    df_st = df_pob[df_pob['Estado_ID'] == state_id]
     
     if not df_st.empty:
         df_st['Rango_Exacto'] = df_st['Indicador'].str.replace(r' \(Hombres\)', '', regex=True).str.replace(r' \(Mujeres\)', '', regex=True)
@@ -1356,73 +2275,23 @@ with col_chart:
 # ==========================================
 # 4.5 GRÁFICAS HISTÓRICAS (IMSS)
 # ==========================================
+diag.seccion("7. Gráficas IMSS")
 st.markdown("<br>", unsafe_allow_html=True)
 col_hist_izq, col_hist_der = st.columns(2)
 
 with col_hist_izq:
-    df_pue = DATA['imss_pue'].copy()
-    col_pue = next((c for c in df_pue.columns if NAME_NORMALIZER.get(c, c) == state_norm), None)
-    
-    # --- RESTAURADO: ESPÍA A SALARIOS para sincronizar cantidad de líneas ---
-    df_sal_temp = DATA['imss_sal'].copy()
-    col_sal_temp = next((c for c in df_sal_temp.columns if NAME_NORMALIZER.get(c, c) == state_norm), None)
-    num_lineas_target = 6 # Valor por defecto fallback
-    
-    if col_sal_temp:
-        df_sal_temp[col_sal_temp] = pd.to_numeric(df_sal_temp[col_sal_temp].astype(str).str.replace(',', '').str.replace(' ', '').str.replace('$', '', regex=False), errors='coerce')
-        df_sal_temp[['Mes_Str', 'Año']] = df_sal_temp['Fecha'].str.split(' ', expand=True)
-        meses_map_temp = {'enero':1, 'febrero':2, 'marzo':3, 'abril':4, 'mayo':5, 'junio':6, 'julio':7, 'agosto':8, 'septiembre':9, 'octubre':10, 'noviembre':11, 'diciembre':12}
-        df_sal_temp['Mes_Num'] = df_sal_temp['Mes_Str'].str.lower().str.strip().map(meses_map_temp)
-        df_sal_temp['Date'] = pd.to_datetime(df_sal_temp['Año'] + '-' + df_sal_temp['Mes_Num'].astype(str).str.zfill(2) + '-01')
-        df_sal_temp = df_sal_temp[df_sal_temp['Date'].dt.year >= 2000]
-        if not df_sal_temp.empty:
-            min_s, max_s = df_sal_temp[col_sal_temp].min(), df_sal_temp[col_sal_temp].max()
-            y_min_s = (min_s // 100) * 100
-            y_max_s = ((max_s // 100) + 1) * 100
-            num_lineas_target = len(range(int(y_min_s), int(y_max_s) + 1, 100))
-    # ------------------------------------------------------------------------
-
-    if col_pue:
-        df_pue[col_pue] = pd.to_numeric(df_pue[col_pue].astype(str).str.replace(',', '').str.replace(' ', ''), errors='coerce')
-        meses_map = {'enero':1, 'febrero':2, 'marzo':3, 'abril':4, 'mayo':5, 'junio':6, 'julio':7, 'agosto':8, 'septiembre':9, 'octubre':10, 'noviembre':11, 'diciembre':12}
-        df_pue['Mes_Num'] = df_pue['Mes'].str.lower().str.strip().map(meses_map)
-        df_pue['Date'] = pd.to_datetime(df_pue['Año'].astype(str) + '-' + df_pue['Mes_Num'].astype(str).str.zfill(2) + '-01')
-        df_pue = df_pue[df_pue['Año'] >= 2000].sort_values('Date').reset_index(drop=True)
-        
-        min_pue, max_pue = df_pue[col_pue].min(), df_pue[col_pue].max()
-        
-        # Algoritmo de pasos usando el num_lineas_target dinámico
-        allowed_steps = [i * 10000 for i in range(1, 51)] + [i * 100000 for i in range(6, 51)]
-        best_step = allowed_steps[0]
-        best_diff = float('inf')
-        for S in allowed_steps:
-            temp_min = (min_pue // S) * S
-            temp_max = ((max_pue // S) + 1) * S
-            lines_count = int((temp_max - temp_min) / S) + 1
-            diff = abs(lines_count - num_lineas_target) # Ahora usa el target dinámico
-            if diff < best_diff: best_diff = diff; best_step = S
-                
-        y_min_pue = (min_pue // best_step) * best_step
-        y_max_pue = ((max_pue // best_step) + 1) * best_step
-        hitos_pue = list(range(int(y_min_pue), int(y_max_pue) + 1, best_step))
-        
-        val_curr = df_pue[col_pue].iloc[-1]
-        val_prev_m = df_pue[col_pue].iloc[-2] if len(df_pue) > 1 else val_curr
-        val_prev_y = df_pue[col_pue].iloc[-13] if len(df_pue) > 12 else val_curr
-        var_m = (val_curr - val_prev_m) / val_prev_m * 100 if val_prev_m else 0
-        var_y = (val_curr - val_prev_y) / val_prev_y * 100 if val_prev_y else 0
-        fecha_str = f"{df_pue['Mes'].iloc[-1].capitalize()} {df_pue['Año'].iloc[-1]}"
-        
-        excluir_pue = ['Año', 'Mes', 'Date', 'Mes_Num', 'Nacional', 'Total', '(Todo)']
-        state_cols_pue = [c for c in df_pue.columns if c not in excluir_pue]
-        last_row_pue = pd.to_numeric(df_pue.iloc[-1][state_cols_pue].astype(str).str.replace(',', '').str.replace(' ', ''), errors='coerce')
-        rk_pue = int(last_row_pue.rank(ascending=False, method='min')[col_pue])
-        top1_pue = last_row_pue.idxmax()
+    pue = CALCULO['imss']['puestos']
+
+    if pue:
+        col_pue, df_pue = pue['col'], pue['serie']
+        # Escala con el número de líneas guía de la gráfica de salarios (resuelta en el cálculo)
+        y_min_pue, y_max_pue = pue['rango']
+        hitos_pue = pue['hitos']
+        val_curr, var_m, var_y, fecha_str = pue['valor'], pue['var_m'], pue['var_y'], pue['fecha']
         
-        # --- NUEVO HOVER PERSONALIZADO ---
-        # Creamos la columna combinando Mes (Capitalizado) y Año
-        df_pue['Hover_Text'] = df_pue['Mes'].str.capitalize() + ' ' + df_pue['Año'].astype(str)
+        rk_pue, top1_pue = get_rank_nacional(("Empleo Formal (IMSS)", "Puestos de Trabajo IMSS"), selected_name)
         
+        # Hover personalizado: Hover_Text combina Mes (capitalizado) y Año
         fig_pue = px.line(df_pue, x='Date', y=col_pue, custom_data=['Hover_Text'])
         
         fig_pue.update_traces(
@@ -1433,16 +2302,13 @@ with col_hist_izq:
         
         for hito in hitos_pue:
             fig_pue.add_hline(y=hito, line_color='#E2E8F0', line_width=1, layer='below')
-            if df_pue[col_pue].iloc[0] < hito: 
-                cruce = df_pue[df_pue[col_pue] >= hito]
-                if not cruce.empty:
-                    primer_cruce = cruce.iloc[0]
-                    fig_pue.add_trace(go.Scatter(
-                        x=[primer_cruce['Date']], y=[primer_cruce[col_pue]], mode='markers+text',
-                        marker=dict(color='white', size=8, line=dict(color='#2596be', width=2)),
-                        text=[f"{primer_cruce['Mes'][:3].capitalize()} {primer_cruce['Año']}"], textposition="top left",
-                        textfont=dict(color="#2596be", size=10, weight="bold"), showlegend=False, hoverinfo='skip'
-                    ))
+        for fecha_cruce, y_cruce, texto_cruce in pue['cruces']:
+            fig_pue.add_trace(go.Scatter(
+                x=[fecha_cruce], y=[y_cruce], mode='markers+text',
+                marker=dict(color='white', size=8, line=dict(color='#2596be', width=2)),
+                text=[texto_cruce], textposition="top left",
+                textfont=dict(color="#2596be", size=10, weight="bold"), showlegend=False, hoverinfo='skip'
+            ))
         
         rank_html = f"Rank: <b>#{rk_pue}</b>" if rk_pue == 1 else f"Rank: <b>#{rk_pue}</b> <span style='font-size:10px; color:#94A3B8;'>(1º {top1_pue})</span>"
         color_m = '#059669' if var_m >=0 else '#DC2626'
@@ -1471,39 +2337,17 @@ with col_hist_izq:
         st.plotly_chart(fig_pue, use_container_width=True)
 
 with col_hist_der:
-    df_sal = DATA['imss_sal'].copy()
-    col_sal = next((c for c in df_sal.columns if NAME_NORMALIZER.get(c, c) == state_norm), None)
+    sal = CALCULO['imss']['salario']
     
-    if col_sal:
-        df_sal[col_sal] = pd.to_numeric(df_sal[col_sal].astype(str).str.replace(',', '').str.replace(' ', '').str.replace('$', '', regex=False), errors='coerce')
-        df_sal[['Mes_Str', 'Año']] = df_sal['Fecha'].str.split(' ', expand=True)
-        meses_map = {'enero':1, 'febrero':2, 'marzo':3, 'abril':4, 'mayo':5, 'junio':6, 'julio':7, 'agosto':8, 'septiembre':9, 'octubre':10, 'noviembre':11, 'diciembre':12}
-        df_sal['Mes_Num'] = df_sal['Mes_Str'].str.lower().str.strip().map(meses_map)
-        df_sal['Date'] = pd.to_datetime(df_sal['Año'] + '-' + df_sal['Mes_Num'].astype(str).str.zfill(2) + '-01')
-        df_sal = df_sal[df_sal['Date'].dt.year >= 2000].sort_values('Date').reset_index(drop=True)
+    if sal:
+        col_sal, df_sal = sal['col'], sal['serie']
+        y_min_sal, y_max_sal = sal['rango']
+        hitos_sal = sal['hitos']
+        val_curr, var_m, var_y, fecha_str = sal['valor'], sal['var_m'], sal['var_y'], sal['fecha']
         
-        min_sal, max_sal = df_sal[col_sal].min(), df_sal[col_sal].max()
-        y_min_sal = (min_sal // 100) * 100
-        y_max_sal = ((max_sal // 100) + 1) * 100
-        hitos_sal = list(range(int(y_min_sal), int(y_max_sal) + 1, 100))
-        
-        val_curr = df_sal[col_sal].iloc[-1]
-        val_prev_m = df_sal[col_sal].iloc[-2] if len(df_sal) > 1 else val_curr
-        val_prev_y = df_sal[col_sal].iloc[-13] if len(df_sal) > 12 else val_curr
-        var_m = (val_curr - val_prev_m) / val_prev_m * 100 if val_prev_m else 0
-        var_y = (val_curr - val_prev_y) / val_prev_y * 100 if val_prev_y else 0
-        fecha_str = df_sal['Fecha'].iloc[-1].title()
-        
-        excluir_sal = ['Fecha', 'Año', 'Mes_Str', 'Mes_Num', 'Date', 'Nacional', 'Total', '(Todo)']
-        state_cols_sal = [c for c in df_sal.columns if c not in excluir_sal]
-        last_row_sal = pd.to_numeric(df_sal.iloc[-1][state_cols_sal].astype(str).str.replace(',', '').str.replace(' ', '').str.replace('$', '', regex=False), errors='coerce')
-        rk_sal = int(last_row_sal.rank(ascending=False, method='min')[col_sal])
-        top1_sal = last_row_sal.idxmax()
-        
-        # --- NUEVO HOVER PERSONALIZADO ---
-        # Creamos la columna combinando Mes_Str (Capitalizado) y Año
-        df_sal['Hover_Text'] = df_sal['Mes_Str'].str.capitalize() + ' ' + df_sal['Año'].astype(str)
+        rk_sal, top1_sal = get_rank_nacional(("Empleo Formal (IMSS)", "Salario Diario IMSS"), selected_name)
         
+        # Hover personalizado: Hover_Text combina Mes_Str (capitalizado) y Año
         fig_sal = px.line(df_sal, x='Date', y=col_sal, custom_data=['Hover_Text'])
         
         fig_sal.update_traces(
@@ -1514,16 +2358,13 @@ with col_hist_der:
         
         for hito in hitos_sal:
             fig_sal.add_hline(y=hito, line_color='#E2E8F0', line_width=1, layer='below')
-            if df_sal[col_sal].iloc[0] < hito: 
-                cruce = df_sal[df_sal[col_sal] >= hito]
-                if not cruce.empty:
-                    primer_cruce = cruce.iloc[0]
-                    fig_sal.add_trace(go.Scatter(
-                        x=[primer_cruce['Date']], y=[primer_cruce[col_sal]], mode='markers+text',
-                        marker=dict(color='white', size=8, line=dict(color='#008889', width=2)),
-                        text=[f"{primer_cruce['Mes_Str'][:3].capitalize()} {primer_cruce['Año']}"], textposition="top left",
-                        textfont=dict(color="#008889", size=10, weight="bold"), showlegend=False, hoverinfo='skip'
-                    ))
+        for fecha_cruce, y_cruce, texto_cruce in sal['cruces']:
+            fig_sal.add_trace(go.Scatter(
+                x=[fecha_cruce], y=[y_cruce], mode='markers+text',
+                marker=dict(color='white', size=8, line=dict(color='#008889', width=2)),
+                text=[texto_cruce], textposition="top left",
+                textfont=dict(color="#008889", size=10, weight="bold"), showlegend=False, hoverinfo='skip'
+            ))
 
         rank_html_sal = f"Rank: <b>#{rk_sal}</b>" if rk_sal == 1 else f"Rank: <b>#{rk_sal}</b> <span style='font-size:10px; color:#94A3B8;'>(1º {top1_sal})</span>"
         color_m = '#059669' if var_m >=0 else '#DC2626'
@@ -1556,9 +2397,10 @@ with col_hist_der:
 # ==========================================
 # SECCIÓN 8: PRODUCTIVIDAD
 # ==========================================
+diag.seccion("8. Productividad")
 st.markdown("<hr style='border-color: #E2E8F0; margin-top: -5px;'>", unsafe_allow_html=True)
 
-df_saic = DATA['saic'].copy() 
+df_saic = copia_local(DATA['saic'], 'saic')
 try:
     anio_saic = df_saic['Anio_Censal'].iloc[0]
     texto_anio_saic = f" ({anio_saic})"
@@ -1568,13 +2410,12 @@ st.header(f"{8 - offset}. Productividad Laboral{texto_anio_saic}")
 st.markdown("<div style='font-size: 0.8rem; color: #94A3B8; margin-top: -15px; margin-bottom: 20px;'>Fuente: Censos Económicos (INEGI)</div>", unsafe_allow_html=True)
 
 df_saic['Entidad_Norm'] = df_saic['Entidad'].str.strip().replace(NAME_NORMALIZER)
-df_saic['Rank'] = df_saic['Indicador_Productividad'].rank(ascending=False)
 row = df_saic[df_saic['Entidad_Norm'] == state_norm]
 
 if not row.empty:
     # Restablecemos las columnas correctas para Productividad
     val = row['Indicador_Productividad'].values[0]
-    rk = int(row['Rank'].values[0])
+    rk = get_rank_nacional(("Productividad", "Productividad Laboral"), selected_name)[0]
     nombre_estado = row['Entidad'].values[0]
     
     top1 = df_saic.sort_values('Indicador_Productividad', ascending=False).iloc[0]
@@ -1623,6 +2464,7 @@ if not row.empty:
 # ==========================================
 # SECCIÓN 9: EDUCACIÓN
 # ==========================================
+diag.seccion("9. Educación")
 st.markdown("<hr style='border-color: #E2E8F0; margin-top: 30px;'>", unsafe_allow_html=True)
 
 try:
@@ -1634,35 +2476,21 @@ st.header(f"{9 - offset}. Educación Superior{texto_ciclo}")
 st.markdown("<div style='font-size: 0.8rem; color: #94A3B8; margin-top: -15px; margin-bottom: 20px;'>Fuente: Anuario Estadístico de la Población Escolar en Educación Superior (ANUIES)</div>", unsafe_allow_html=True)
 
 try:
-    df_tot, df_mat, df_egr = DATA['edu_tot'].copy(), DATA['edu_mat'].copy(), DATA['edu_egr'].copy()
-
-    def clean_cols(df, cols):
-        for col in cols:
-            if col in df.columns and df[col].dtype == object:
-                df[col] = df[col].astype(str).str.replace(',', '').astype(float)
-        return df
-
-    df_tot = clean_cols(df_tot, ['Matrícula Total', 'Egresados Total'])
-    df_mat = clean_cols(df_mat, ['Matrícula Total', 'Participacion_Matricula'])
-    df_egr = clean_cols(df_egr, ['Egresados Total', 'Participacion_Egresados'])
-
-    def clean_entidad(name): return NAME_NORMALIZER.get(str(name).strip().title(), str(name).strip().title())
-
-    def get_edu_context(df_full, val_col, state_target, nivel=None, campo=None):
-        df_f = df_full.copy()
-        if nivel: df_f = df_f[df_f['Nivel_Agrupado'] == nivel]
-        if campo: df_f = df_f[df_f['CAMPO AMPLIO'] == campo]
-        df_f['ENTIDAD_NORM'] = df_f['ENTIDAD'].apply(clean_entidad)
-        state_tgt_norm = clean_entidad(state_target)
-        agg = df_f.groupby('ENTIDAD_NORM')[val_col].sum().reset_index()
-        tot_nac = agg[val_col].sum()
-        if tot_nac == 0 or agg.empty: return 0, 0, "-", 0
-        agg['Rank'] = agg[val_col].rank(ascending=False, method='min')
-        agg = agg.sort_values('Rank')
-        top1 = agg.iloc[0]['ENTIDAD_NORM']
-        st_row = agg[agg['ENTIDAD_NORM'].str.upper() == state_tgt_norm.upper()]
-        if st_row.empty: return 0, 0, top1, 0
-        return st_row.iloc[0][val_col], int(st_row.iloc[0]['Rank']), top1, (st_row.iloc[0][val_col] / tot_nac) * 100
+    edu = CALCULO['educacion']
+    if 'error' in edu: raise RuntimeError(edu['error'])  # el cálculo falló: mismo aviso que antes
+
+    @diag.instrumentar()
+    def get_edu_context(val_col, state_target, nivel=None):
+        # Totales por entidad (y por nivel): se leen de la matriz nacional precalculada
+        clave = ("Educación Superior", val_col) if nivel is None else ("Educación por Nivel", f"{val_col.split()[0]} {nivel}")
+        if clave not in RANKINGS['valores'].index: return 0, 0, "-", 0
+        fila = RANKINGS['valores'].loc[clave]
+        tot_nac = fila.sum()
+        estado = NAME_NORMALIZER.get(str(state_target).strip(), str(state_target).strip())
+        rk, top1 = get_rank_nacional(clave, estado)
+        val = fila.get(estado, np.nan)
+        if tot_nac == 0 or pd.isna(val): return 0, 0, top1, 0
+        return val, rk, top1, (val / tot_nac) * 100
 
     def main_stat_html(title, data_tuple, color_main):
         val, rank, top1, share = data_tuple
@@ -1695,20 +2523,19 @@ try:
 </div>"""
 
     state_target = state_norm 
-    df_tot_est = df_tot[df_tot['ENTIDAD'].apply(clean_entidad).str.upper() == state_target.upper()]
     
-    if not df_tot_est.empty:
-        ctx_mat_tot = get_edu_context(df_tot, 'Matrícula Total', state_target)
-        ctx_mat_lic = get_edu_context(df_tot, 'Matrícula Total', state_target, 'Licenciatura')
-        ctx_mat_tsu = get_edu_context(df_tot, 'Matrícula Total', state_target, 'Técnico Superior')
-        ctx_mat_mae = get_edu_context(df_tot, 'Matrícula Total', state_target, 'Maestría')
-        ctx_mat_doc = get_edu_context(df_tot, 'Matrícula Total', state_target, 'Doctorado')
-
-        ctx_egr_tot = get_edu_context(df_tot, 'Egresados Total', state_target)
-        ctx_egr_lic = get_edu_context(df_tot, 'Egresados Total', state_target, 'Licenciatura')
-        ctx_egr_tsu = get_edu_context(df_tot, 'Egresados Total', state_target, 'Técnico Superior')
-        ctx_egr_mae = get_edu_context(df_tot, 'Egresados Total', state_target, 'Maestría')
-        ctx_egr_doc = get_edu_context(df_tot, 'Egresados Total', state_target, 'Doctorado')
+    if edu['hay_estado']:
+        ctx_mat_tot = get_edu_context('Matrícula Total', state_target)
+        ctx_mat_lic = get_edu_context('Matrícula Total', state_target, 'Licenciatura')
+        ctx_mat_tsu = get_edu_context('Matrícula Total', state_target, 'Técnico Superior')
+        ctx_mat_mae = get_edu_context('Matrícula Total', state_target, 'Maestría')
+        ctx_mat_doc = get_edu_context('Matrícula Total', state_target, 'Doctorado')
+
+        ctx_egr_tot = get_edu_context('Egresados Total', state_target)
+        ctx_egr_lic = get_edu_context('Egresados Total', state_target, 'Licenciatura')
+        ctx_egr_tsu = get_edu_context('Egresados Total', state_target, 'Técnico Superior')
+        ctx_egr_mae = get_edu_context('Egresados Total', state_target, 'Maestría')
+        ctx_egr_doc = get_edu_context('Egresados Total', state_target, 'Doctorado')
 
         # --- AQUI SE HOMOLOGARON LOS COLORES ---
         html_general = f"""<div style="border-left: 6px solid #2596be; margin-bottom: 30px; background-color: #ffffff; padding: 25px; border-radius: 12px; box-shadow: 0 4px 15px rgba(0,0,0,0.03); border: 1px solid #E2E8F0;">
@@ -1735,17 +2562,6 @@ try:
         st.markdown("<h4 style='color:#0F172A; font-weight:800;'>Principal Campo de Formación por Nivel</h4>", unsafe_allow_html=True)
         col_mat, col_egr = st.columns(2)
 
-        niveles_orden = ['Licenciatura', 'Técnico Superior', 'Maestría', 'Doctorado']
-        df_top_mat_est = df_mat[df_mat['ENTIDAD'].apply(clean_entidad).str.upper() == state_target.upper()]
-        df_top_egr_est = df_egr[df_egr['ENTIDAD'].apply(clean_entidad).str.upper() == state_target.upper()]
-
-        def get_top1_by_level(df, nivel, val_col, share_col):
-            subset = df[df['Nivel_Agrupado'] == nivel]
-            if not subset.empty:
-                row = subset.sort_values(val_col, ascending=False).iloc[0]
-                return row['CAMPO AMPLIO'], row[val_col], row[share_col]
-            return None, 0, 0
-
         def campo_card_html(nivel, campo, val_est, share_est, ctx_tuple, color_main, label_val):
             val_nac, rk_nac, top1_nac, sh_nac = ctx_tuple
             return f"""<div class="card-hover" style="background: white; padding: 20px; border-radius: 12px; border-top: 4px solid {color_main}; box-shadow: 0 4px 10px rgba(0,0,0,0.03); border-left:1px solid #E2E8F0; border-right:1px solid #E2E8F0; border-bottom:1px solid #E2E8F0; margin-bottom: 15px;">
@@ -1773,15 +2589,13 @@ try:
 
         with col_mat:
             st.markdown(f"<div style='margin-bottom:15px; font-weight:800; color:#2596be; font-size:1.1rem;'>Por Matrícula</div>", unsafe_allow_html=True)
-            for nivel in niveles_orden:
-                campo, val, share = get_top1_by_level(df_top_mat_est, nivel, 'Matrícula Total', 'Participacion_Matricula')
-                if campo: st.markdown(campo_card_html(nivel, campo, val, share, get_edu_context(df_mat, 'Matrícula Total', state_target, nivel, campo), "#2596be", "Alumnos"), unsafe_allow_html=True)
+            for nivel, campo, val, share, ctx in edu['matricula']:
+                st.markdown(campo_card_html(nivel, campo, val, share, ctx, "#2596be", "Alumnos"), unsafe_allow_html=True)
 
         with col_egr:
             st.markdown(f"<div style='margin-bottom:15px; font-weight:800; color:#008889; font-size:1.1rem;'>Por Egresados</div>", unsafe_allow_html=True)
-            for nivel in niveles_orden:
-                campo, val, share = get_top1_by_level(df_top_egr_est, nivel, 'Egresados Total', 'Participacion_Egresados')
-                if campo: st.markdown(campo_card_html(nivel, campo, val, share, get_edu_context(df_egr, 'Egresados Total', state_target, nivel, campo), "#008889", "Egresados"), unsafe_allow_html=True)
+            for nivel, campo, val, share, ctx in edu['egresados']:
+                st.markdown(campo_card_html(nivel, campo, val, share, ctx, "#008889", "Egresados"), unsafe_allow_html=True)
 
 except Exception as e: st.error(f"Error procesando educación: {str(e)}")
 
@@ -1790,9 +2604,10 @@ mostrar_fecha_act('edu')
 # ==========================================
 # SECCIÓN 10: IMCO
 # ==========================================
+diag.seccion("10. Competitividad")
 st.markdown("<hr style='border-color: #E2E8F0;'>", unsafe_allow_html=True)
 
-df_g = DATA['imco_g'].copy()
+df_g = copia_local(DATA['imco_g'], 'imco_g')
 try:
     col_anio_candidatas = [c for c in df_g.columns if str(c).strip().upper().startswith('A') and str(c).strip().lower().endswith('o')]
     col_anio = col_anio_candidatas[0] if col_anio_candidatas else 'AÃ±o'
@@ -1847,25 +2662,10 @@ if not row.empty:
     fig.update_layout(yaxis_title="Competitividad", xaxis_title="", xaxis_tickangle=-90, margin=dict(t=30, b=0, l=0, r=0), showlegend=False, plot_bgcolor='white', paper_bgcolor='white')
     st.plotly_chart(fig, use_container_width=True)
 
-df_d = DATA['imco_d'].copy()
-df_d['Entidad_Norm'] = df_d['Entidad'].str.strip().replace(NAME_NORMALIZER)
-st_d = df_d[df_d['Entidad_Norm'] == state_norm].copy()
-
-INDICADORES_IGNORADOS = ["Acceso a internet"]
-CORRECCION_NOMBRES = {"Perc. de corrupción estatal": "Percepción de corrupción estatal"}
-
-if not st_d.empty:
-    st_d = st_d[~st_d['Indicador'].isin(INDICADORES_IGNORADOS)].copy()
-    st_d['Indicador'] = st_d['Indicador'].replace(CORRECCION_NOMBRES)
-
-    TIPO_INDICADOR = {"Acceso a instituciones de salud": "Directo", "Camas de hospital": "Directo", "Captación de ahorro": "Directo", "Carga aérea": "Directo", "Cobertura educativa": "Directo", "Competencia en servicios notariales": "Directo", "Consulta info finanzas públicas": "Directo", "Crecimiento de UE >50 empleados": "Directo", "Crecimiento del PIB": "Directo", "Crecimiento puestos de trabajo (IMSS)": "Directo", "Diversificación económica": "Directo", "Esperanza de vida": "Directo", "Flujo de pasajeros aéreos": "Directo", "Grado de escolaridad": "Directo", "Ingreso promedio de tiempo completo": "Directo", "Ingresos propios": "Directo", "Mujeres económicamente activas": "Directo", "Participación ciudadana en elecciones": "Directo", "Patentes": "Directo", "Percepción de seguridad": "Directo", "Personal médico con especialidad": "Directo", "Personal médico y de enfermería": "Directo", "Población con educación superior": "Directo", "Tasa de participación": "Directo", "Terminales punto de venta": "Directo", "Uso de banca móvil": "Directo", "Agresiones a periodistas": "Inverso", "Brecha de ingresos por género": "Inverso", "Costo promedio de la deuda": "Inverso", "Delitos no denunciados": "Inverso", "Desigualdad salarial": "Inverso", "Deuda estatal y organismos": "Inverso", "Diferencia de informalidad laboral H-M": "Inverso", "Heridos en accidentes de tránsito terrestre": "Inverso", "Homicidios": "Inverso", "Incidencia delictiva": "Inverso", "Informalidad laboral": "Inverso", "Jornadas laborales >48h": "Inverso", "Morbilidad respiratoria": "Inverso", "Percepción de corrupción estatal": "Inverso", "Personas con ingresos debajo de la línea de bienestar": "Inverso", "Robo de vehículos": "Inverso"}
-
-    def calc_puntaje(row): return row['Rank'] if TIPO_INDICADOR.get(str(row['Indicador']).strip(), "Directo") == "Directo" else 33 - row['Rank']
-    def calc_cambio(row): return row['Cambio_Posicion'] if TIPO_INDICADOR.get(str(row['Indicador']).strip(), "Directo") == "Directo" else -row['Cambio_Posicion']
-
-    st_d['Puntaje_Fortaleza'] = st_d.apply(calc_puntaje, axis=1)
-    st_d['Cambio_Ajustado'] = st_d.apply(calc_cambio, axis=1)
+# Fortalezas y áreas de oportunidad: posiciones ajustadas por tipo de indicador (calculo_estatal)
+imco = CALCULO['imco']
 
+if imco:
     st.markdown("<br>", unsafe_allow_html=True)
     c1, c2 = st.columns(2)
     
@@ -1876,16 +2676,117 @@ if not st_d.empty:
 
     with c1:
         st.markdown("<div style='background:white; padding:20px; border-radius:12px; border-top:4px solid #2596be; box-shadow: 0 4px 6px rgba(0,0,0,0.02);'><h4 style='color:#0F172A; margin-top:0;'>✅ Fortalezas</h4>", unsafe_allow_html=True)
-        for _, r in st_d.sort_values('Puntaje_Fortaleza').head(5).iterrows():
-            st.markdown(f"<div style='padding:8px 0; border-bottom:1px solid #F1F5F9; color:#334155;'><b style='color:#0F172A;'>#{int(r['Rank'])}</b> {r['Indicador']} {badge_html(r['Cambio_Ajustado'])}</div>", unsafe_allow_html=True)
+        for rank, indicador, cambio in imco['fortalezas']:
+            st.markdown(f"<div style='padding:8px 0; border-bottom:1px solid #F1F5F9; color:#334155;'><b style='color:#0F172A;'>#{rank}</b> {indicador} {badge_html(cambio)}</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
     with c2:
         st.markdown("<div style='background:white; padding:20px; border-radius:12px; border-top:4px solid #008889; box-shadow: 0 4px 6px rgba(0,0,0,0.02);'><h4 style='color:#0F172A; margin-top:0;'>⚠️ Áreas de oportunidad</h4>", unsafe_allow_html=True)
-        for _, r in st_d.sort_values('Puntaje_Fortaleza', ascending=False).head(5).iterrows():
-            st.markdown(f"<div style='padding:8px 0; border-bottom:1px solid #F1F5F9; color:#334155;'><b style='color:#0F172A;'>#{int(r['Rank'])}</b> {r['Indicador']} {badge_html(r['Cambio_Ajustado'])}</div>", unsafe_allow_html=True)
+        for rank, indicador, cambio in imco['oportunidades']:
+            st.markdown(f"<div style='padding:8px 0; border-bottom:1px solid #F1F5F9; color:#334155;'><b style='color:#0F172A;'>#{rank}</b> {indicador} {badge_html(cambio)}</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
             
     st.info("ℹ️ **Nota:** El cambio de posiciones corresponde a la variación respecto al año anterior.")
 
+# --- ÍNDICE COMPUESTO PERSONALIZADO ---
+INDICADORES_COMPUESTO_DEFAULT = ["Crecimiento PIB estatal (%)", "Crecimiento de exportaciones (%)", "IED (MDD)", "Tasa de informalidad laboral (%)"]
+
+@st.fragment
+def render_indice_compuesto(z_data, estado_norm):
+    # Fragmento: mover un peso solo re-ejecuta este bloque, no la ficha completa
+    st.markdown("<h4 style='color:#0F172A; font-weight:800; margin-top: 25px;'>Índice Compuesto Personalizado</h4>", unsafe_allow_html=True)
+    st.markdown("<div style='font-size: 0.85rem; color: #64748B; margin-bottom: 10px;'>Elige indicadores y asigna pesos para reordenar a las 32 entidades. Cada indicador se estandariza y se orienta para que un valor mayor siempre sea favorable.</div>", unsafe_allow_html=True)
+
+    opciones = z_data['indicadores']
+    pos_ind = {ind: k for k, ind in enumerate(opciones)}
+    grupo_ind = dict(zip(opciones, z_data['grupos']))
+    seleccion = st.multiselect(
+        "Indicadores", opciones,
+        default=[i for i in INDICADORES_COMPUESTO_DEFAULT if i in pos_ind],
+        format_func=lambda x: f"{x} ({grupo_ind[x]})",
+        key="compuesto_indicadores"
+    )
+    if not seleccion:
+        st.caption("Selecciona al menos un indicador.")
+        return
+
+    pesos = np.zeros(len(opciones))
+    cols_w = st.columns(min(len(seleccion), 4))
+    for k, ind in enumerate(seleccion):
+        with cols_w[k % len(cols_w)]:
+            pesos[pos_ind[ind]] = st.slider(ind, 0, 10, 5, key=f"peso_{ind}")
+    if pesos.sum() == 0:
+        st.caption("Asigna un peso mayor a cero a al menos un indicador.")
+        return
+
+    puntaje = z_data['Z'] @ (pesos / pesos.sum())
+    orden = np.argsort(-puntaje, kind='stable')
+    estados_ord = z_data['estados'][orden]
+    puntaje_ord = puntaje[orden]
+    pos_estado = np.flatnonzero(estados_ord == estado_norm)
+
+    cc1, cc2, cc3 = st.columns(3)
+    if pos_estado.size:
+        with cc1: render_custom_metric("Posición", f"#{pos_estado[0] + 1}", estado_norm)
+        with cc2: render_custom_metric("Puntaje", f"{puntaje_ord[pos_estado[0]]:+.2f}", "Desviaciones estándar vs promedio")
+    with cc3: render_custom_metric("1er Lugar", estados_ord[0], f"Puntaje: {puntaje_ord[0]:+.2f}")
+
+    colors = ['#008889' if x == estado_norm else '#CBD5E1' for x in estados_ord]
+    fig = px.bar(x=estados_ord, y=puntaje_ord)
+    fig.update_traces(marker_color=colors, hovertemplate="<span style='font-size: 16px;'><b>%{y:+.2f}</b></span><extra></extra>")
+    fig.add_hline(y=0, line_dash="dash", line_color="#475569", annotation_text="Promedio Nacional", annotation_font_color="#475569")
+    fig.update_layout(yaxis_title="Puntaje compuesto", xaxis_title="", xaxis_tickangle=-90, margin=dict(t=30, b=0, l=0, r=0), showlegend=False, plot_bgcolor='white', paper_bgcolor='white')
+    st.plotly_chart(fig, use_container_width=True)
+
+render_indice_compuesto(get_zscore_matrix(DATA, DATA_VERSION), state_norm)
+
 mostrar_fecha_act('imco')
 
+# ==========================================
+# SECCIÓN 11: ESTADOS SIMILARES
+# ==========================================
+diag.seccion("11. Estados Similares")
+st.markdown("<hr style='border-color: #E2E8F0;'>", unsafe_allow_html=True)
+
+st.header(f"{11 - offset}. Estados Similares")
+st.markdown("<div style='font-size: 0.8rem; color: #94A3B8; margin-top: -15px; margin-bottom: 20px;'>Fuente: Elaboración propia con PIB y Exportaciones por Entidad Federativa (INEGI), ENOE (INEGI) e Índice de Competitividad Estatal (IMCO)</div>", unsafe_allow_html=True)
+
+TOP_K_SIMILARES = 5
+sim_data = get_similarity_matrix(DATA, DATA_VERSION)
+similares = get_similar_states(sim_data, state_id, k=TOP_K_SIMILARES)
+
+if similares:
+    cols_sim = st.columns(len(similares))
+    for i, (col, peer) in enumerate(zip(cols_sim, similares)):
+        html_rasgos = "".join(
+            f"<div style='margin-bottom: 6px; font-size: 0.8rem; color:#475569; border-left: 2px solid #2596be; padding-left: 8px;'>{nombre} <b style='color:#2596be;'>{'▲' if arriba else '▼'}</b></div>"
+            for nombre, arriba in peer['Rasgos']
+        )
+        col.markdown(f"""<div class="card-hover" style="background: white; padding: 18px; border-radius: 12px; border-top: 4px solid #2596be; box-shadow: 0 4px 10px rgba(0,0,0,0.03); border-left:1px solid #E2E8F0; border-right:1px solid #E2E8F0; border-bottom:1px solid #E2E8F0; height: 100%;">
+<div style="display: flex; justify-content: space-between; align-items: flex-start;">
+<div style="font-size:0.8rem; color:#64748B; font-weight:800; text-transform: uppercase; letter-spacing: 0.5px;">Similitud</div>
+<div style="background-color: #2596be; color: white; padding: 2px 10px; border-radius: 12px; font-size: 0.75rem; font-weight: bold;">#{i + 1}</div>
+</div>
+<div style="font-weight:800; font-size:1.2rem; color:#0F172A; margin: 8px 0 4px 0;">{peer['Estado']}</div>
+<div style="color:#2596be; font-weight:900; font-size:1.6rem; margin-bottom: 12px;">{peer['Similitud'] * 100:.0f}%</div>
+<div style="font-size:0.75rem; color:#64748B; font-weight:800; text-transform: uppercase; margin-bottom: 8px;">Rasgos en común</div>
+{html_rasgos}
+</div>""", unsafe_allow_html=True)
+
+    st.info("ℹ️ **Nota:** La similitud coseno compara la estructura del PIB, la mezcla exportadora, el mercado laboral (ENOE) y las posiciones IMCO, con igual peso por bloque. ▲/▼ indica si ambos estados están por arriba o por debajo del promedio nacional en ese rasgo.")
+else:
+    st.info("No hay información suficiente para calcular estados similares.")
+
+# ==========================================
+# PREFETCH DE LOS SIGUIENTES ESTADOS PROBABLES
+# ==========================================
+diag.seccion("Prefetch")
+if PREFETCH_ESTADOS > 0:
+    predichos = predecir_siguientes(
+        selected_name, st.session_state.get('transiciones', {}), get_transiciones().desde(selected_name),
+        vecinos_estado(selected_name, sim_data), PREFETCH_ESTADOS
+    )
+    st.session_state['prefetch_predichos'] = predichos
+    diag.contexto(prefetch=predichos)
+    get_prefetch().pedir(DATA, DATA_VERSION, predichos)
+
+mostrar_diagnostico()
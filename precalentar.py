@@ -0,0 +1,97 @@
+"""
+Precalentamiento de la ficha estatal al arrancar el servidor.
+
+Streamlit no ejecuta la app hasta que se conecta la primera sesión, y es esa ejecución la que
+carga los datos, calcula las matrices nacionales y lanza el hilo que precalienta los 32 estados
+(ver Precalentamiento en ficha_v2.py). Este script hace de esa primera sesión: espera a que el
+servidor responda, abre una sesión por el mismo websocket que usa el navegador, ejecuta la ficha
+una vez y sigue el avance en logs/precalentamiento.json hasta que todos los estados están listos.
+Así ningún usuario real paga la carga en frío.
+
+Uso (desde la raíz del repositorio, junto al servidor):
+    streamlit run ficha_v2.py & python precalentar.py
+    python precalentar.py --url ws://localhost:8501 --espera 600
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+
+from benchmark import RAIZ
+from prueba_carga import Sesion
+
+RUTA_AVANCE = os.path.join(RAIZ, "logs", "precalentamiento.json")
+
+def esperar_servidor(url, timeout):
+    salud = url.replace("ws://", "http://").replace("wss://", "https://") + "/_stcore/health"
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            with urllib.request.urlopen(salud, timeout=2) as r:
+                if r.status == 200: return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"El servidor no respondió en {timeout}s ({salud})")
+
+async def primera_ejecucion(url, timeout):
+    # Una ejecución completa de la ficha, como la primera carga del navegador: la sesión simulada
+    # de prueba_carga.py, que termina tras la carga inicial porque su plazo ya venció
+    opciones = argparse.Namespace(timeout=timeout, rampa=0, pensar=0, prob_vista=0)
+    sesion = Sesion(0, url, [], random.Random(0), opciones)
+    await sesion.correr(time.time())
+    registro = sesion.registros[0]
+    if registro['accion'] == 'conexion': raise ConnectionError(registro['error'])
+    return registro['latencia_s'], registro
+
+def leer_avance(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as f: return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def seguir_avance(ruta, espera, intervalo=1.0):
+    # El archivo se reescribe al iniciar el precalentamiento, de modo que tras la primera ejecución
+    # ya refleja la versión de datos del servidor en curso
+    limite = time.time() + espera
+    ultimo = None
+    while time.time() < limite:
+        avance = leer_avance(ruta)
+        if avance is None:
+            print(f"⚠️ No se encontró {ruta}: ¿el servidor corre con FICHA_PRECALENTAR=0?")
+            return False
+        linea = f"   {avance['hechos']}/{avance['total']} estados ({avance['segundos']:,.1f}s)"
+        if avance['actual']: linea += f", calculando {avance['actual']}"
+        if linea != ultimo: print(linea, flush=True)
+        ultimo = linea
+        if avance['terminado'] or avance['cancelado']:
+            for estado, error in avance['errores'].items(): print(f"   ⚠️ {estado}: {error}")
+            return avance['terminado'] and not avance['errores']
+        time.sleep(intervalo)
+    print(f"⚠️ El precalentamiento no terminó en {espera}s")
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="ws://localhost:8501", help="Servidor de la ficha")
+    parser.add_argument("--espera", type=float, default=600, help="Tiempo máximo para que terminen los 32 estados (s)")
+    parser.add_argument("--timeout", type=float, default=180, help="Tiempo máximo del arranque y de la primera ejecución (s)")
+    parser.add_argument("--avance", default=RUTA_AVANCE, help="Archivo de avance que escribe la ficha")
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    esperar_servidor(url, args.timeout)
+    segundos, registro = asyncio.run(primera_ejecucion(url, args.timeout))
+    print(f"🚀 Primera ejecución (carga de datos y matrices): {segundos:.2f}s")
+    if registro['error']: print(f"⚠️ La ejecución terminó con {registro['error']}")
+    for excepcion in registro['excepciones']: print(f"⚠️ {excepcion}")
+    print("🔥 Precalentando estados:")
+    ok = seguir_avance(args.avance, args.espera)
+    if ok: print("✅ Todos los estados en caché")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
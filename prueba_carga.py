@@ -0,0 +1,306 @@
+"""
+Prueba de carga multi-sesión de la ficha estatal.
+
+Levanta `streamlit run ficha_v2.py` (o se conecta a un servidor ya iniciado con --url) y abre N
+sesiones concurrentes por el mismo websocket que usa el navegador. Cada sesión reproduce un flujo
+de clics realista: espera un tiempo de lectura, cambia de estado con los botones del sidebar
+(a veces regresa al anterior para comparar) y de vez en cuando cambia de vista. Con --trazas se
+reproducen en su lugar las secuencias de estado/vista registradas por el diagnóstico
+(logs/trazas_ficha.jsonl).
+
+Se mide la latencia de cada rerun (desde el envío del clic hasta que el servidor reporta el fin
+del script), el throughput y el RSS del proceso servidor a lo largo de la prueba. El reporte
+incluye p50/p95/p99 globales y por tipo de acción, y una serie temporal por intervalo; se guarda
+en JSON junto a los de benchmark.py para comparar builds y dimensionar réplicas.
+
+El RSS se lee de /proc (Linux) y solo está disponible cuando el servidor corre en la misma máquina.
+
+Uso (desde la raíz del repositorio):
+    python prueba_carga.py --sesiones 20 --duracion 120
+    python prueba_carga.py --url ws://localhost:8501 --pid 12345 --sesiones 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from benchmark import RAIZ, commit_actual, leer_state_map
+
+VISTAS = ["Ficha estatal", "Comparar estados", "Ranking nacional"]
+PROB_REGRESO = 0.3  # probabilidad de volver al estado anterior (comparar dos estados)
+FIN_EXITOSO = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)
+
+def percentiles(valores):
+    if not valores: return {'p50_s': None, 'p95_s': None, 'p99_s': None, 'media_s': None, 'max_s': None}
+    p50, p95, p99 = np.percentile(valores, [50, 95, 99])
+    return {
+        'p50_s': round(float(p50), 4), 'p95_s': round(float(p95), 4), 'p99_s': round(float(p99), 4),
+        'media_s': round(float(np.mean(valores)), 4), 'max_s': round(float(np.max(valores)), 4)
+    }
+
+def rss_mb(pid):
+    # Memoria residente del servidor desde /proc; None si no se puede leer (otro host u otro SO)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def iniciar_servidor(app, puerto, timeout=90):
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app, "--server.headless", "true",
+         "--server.port", str(puerto), "--browser.gatherUsageStats", "false"],
+        cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    limite = time.time() + timeout
+    while time.time() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con código {proceso.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://localhost:{puerto}/_stcore/health", timeout=2) as r:
+                if r.status == 200: return proceso
+        except OSError:
+            time.sleep(0.5)
+    proceso.terminate()
+    raise TimeoutError(f"El servidor no respondió en {timeout}s")
+
+def leer_trazas(ruta):
+    # Secuencia (estado, vista) de las ejecuciones registradas, sin repeticiones consecutivas
+    pasos = []
+    with open(ruta, encoding='utf-8') as f:
+        for linea in f:
+            try:
+                r = json.loads(linea)
+            except json.JSONDecodeError:
+                continue
+            paso = (r.get('estado'), r.get('vista') or VISTAS[0])
+            if paso[0] and (not pasos or pasos[-1] != paso): pasos.append(paso)
+    return pasos
+
+class Sesion:
+    """Una sesión de navegador simulada: mantiene el estado de sus widgets y registra cada rerun."""
+
+    def __init__(self, num, url, estados, rng, args, trazas=None):
+        self.num, self.url, self.estados, self.rng, self.args = num, url, estados, rng, args
+        self.trazas = trazas
+        self.paso_traza = rng.randrange(len(trazas)) if trazas else 0
+        self.botones = {}
+        self.radio_vista = None
+        self.vista = VISTAS[0]
+        self.estado = None
+        self.estado_anterior = None
+        self.registros = []
+
+    def siguiente_accion(self):
+        if self.trazas:
+            self.paso_traza = (self.paso_traza + 1) % len(self.trazas)
+            estado, vista = self.trazas[self.paso_traza]
+            if vista != self.vista and vista in VISTAS: return 'vista', vista
+            return 'estado', estado
+        if self.radio_vista and self.rng.random() < self.args.prob_vista:
+            return 'vista', self.rng.choice([v for v in VISTAS if v != self.vista])
+        if self.estado_anterior and self.estado_anterior != self.estado and self.rng.random() < PROB_REGRESO:
+            return 'estado', self.estado_anterior
+        return 'estado', self.rng.choice([e for e in self.estados if e != self.estado])
+
+    def widgets(self, accion, valor):
+        # Como el navegador: el radio de vista conserva su valor y el botón solo dispara en este rerun
+        estados = []
+        vista = valor if accion == 'vista' else self.vista
+        if self.radio_vista and vista != VISTAS[0]:
+            estados.append(WidgetState(id=self.radio_vista, string_value=vista))
+        if accion == 'estado' and valor in self.botones:
+            estados.append(WidgetState(id=self.botones[valor], trigger_value=True))
+        return estados
+
+    async def rerun(self, ws, accion, valor):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        msg.rerun_script.widget_states.widgets.extend(self.widgets(accion, valor))
+        estado_previo = self.estado
+        t0 = time.perf_counter()
+        await ws.send(msg.SerializeToString())
+        n_bytes, excepciones, estado_fin = 0, [], None
+        while estado_fin is None:
+            crudo = await asyncio.wait_for(ws.recv(), timeout=self.args.timeout)
+            n_bytes += len(crudo)
+            fwd = ForwardMsg()
+            fwd.ParseFromString(crudo)
+            tipo = fwd.WhichOneof('type')
+            if tipo == 'delta' and fwd.delta.WhichOneof('type') == 'new_element':
+                el = fwd.delta.new_element
+                tipo_el = el.WhichOneof('type')
+                if tipo_el == 'button':
+                    self.botones[el.button.label] = el.button.id
+                    if el.button.type == "primary" and el.button.label in self.estados: self.estado = el.button.label
+                elif tipo_el == 'radio' and list(el.radio.options) == VISTAS: self.radio_vista = el.radio.id
+                elif tipo_el == 'exception': excepciones.append(f"{el.exception.type}: {el.exception.message}"[:200])
+            elif tipo == 'script_finished':
+                estado_fin = fwd.script_finished
+        latencia = time.perf_counter() - t0
+        if accion == 'vista': self.vista = valor
+        if self.estado != estado_previo: self.estado_anterior = estado_previo
+        self.registros.append({
+            't': time.time(), 'sesion': self.num, 'accion': accion, 'valor': valor,
+            'latencia_s': latencia, 'bytes': n_bytes, 'excepciones': excepciones,
+            'error': None if estado_fin in FIN_EXITOSO else f"script_finished={estado_fin}"
+        })
+
+    async def correr(self, fin):
+        await asyncio.sleep(self.rng.uniform(0, self.args.rampa))
+        try:
+            async with websockets.connect(f"{self.url}/_stcore/stream", subprotocols=["streamlit"], max_size=None) as ws:
+                # Primera carga: la app arranca en el estado por defecto
+                await self.rerun(ws, 'inicial', None)
+                while time.time() < fin:
+                    await asyncio.sleep(self.rng.expovariate(1 / self.args.pensar) if self.args.pensar > 0 else 0)
+                    if time.time() >= fin: break
+                    await self.rerun(ws, *self.siguiente_accion())
+        except Exception as e:
+            self.registros.append({
+                't': time.time(), 'sesion': self.num, 'accion': 'conexion', 'valor': None,
+                'latencia_s': None, 'bytes': 0, 'excepciones': [], 'error': f"{type(e).__name__}: {e}"
+            })
+
+async def muestrear_rss(pid, fin, intervalo, muestras):
+    while time.time() < fin:
+        muestras.append({'t': time.time(), 'rss_mb': rss_mb(pid) if pid else None})
+        await asyncio.sleep(intervalo)
+
+async def ejecutar(url, estados, pid, args):
+    rng = random.Random(args.semilla)
+    trazas = leer_trazas(args.trazas) if args.trazas else None
+    if trazas is not None and not trazas:
+        raise ValueError(f"{args.trazas} no tiene ejecuciones con estado registrado")
+    sesiones = [Sesion(i, url, estados, random.Random(rng.random()), args, trazas) for i in range(args.sesiones)]
+    inicio = time.time()
+    fin = inicio + args.rampa + args.duracion
+    muestras = []
+    await asyncio.gather(muestrear_rss(pid, fin, args.intervalo, muestras), *(s.correr(fin) for s in sesiones))
+    registros = [r for s in sesiones for r in s.registros]
+    return inicio, registros, muestras
+
+def resumir(inicio, registros, muestras, args):
+    df = pd.DataFrame(registros)
+    ok = df[df['error'].isna()] if not df.empty else df
+    duracion = max((df['t'].max() if not df.empty else inicio) - inicio, 1e-9)
+    resumen = {
+        'reruns': int(len(ok)),
+        'errores': int(df['error'].notna().sum()) if not df.empty else 0,
+        'excepciones_app': int(df['excepciones'].str.len().sum()) if not df.empty else 0,
+        'throughput_rps': round(len(ok) / duracion, 3),
+        'bytes_mediana': int(ok['bytes'].median()) if not ok.empty else None,
+        **percentiles(ok['latencia_s'].tolist() if not ok.empty else [])
+    }
+    por_accion = [
+        {'accion': accion, 'reruns': int(len(d)), **percentiles(d['latencia_s'].tolist())}
+        for accion, d in ok.groupby('accion', sort=False)
+    ] if not ok.empty else []
+
+    # Serie temporal: reruns terminados, latencia y RSS por intervalo
+    serie = []
+    rss = pd.DataFrame(muestras)
+    n_intervalos = int(np.ceil(duracion / args.intervalo_reporte)) or 1
+    for k in range(n_intervalos):
+        a, b = inicio + k * args.intervalo_reporte, inicio + (k + 1) * args.intervalo_reporte
+        d = ok[(ok['t'] >= a) & (ok['t'] < b)] if not ok.empty else ok
+        r = rss[(rss['t'] >= a) & (rss['t'] < b)]['rss_mb'].dropna() if not rss.empty else pd.Series(dtype=float)
+        activas = df[(df['t'] >= a) & (df['t'] < b)]['sesion'].nunique() if not df.empty else 0
+        serie.append({
+            'desde_s': round(a - inicio, 1), 'sesiones_activas': int(activas), 'reruns': int(len(d)),
+            'throughput_rps': round(len(d) / args.intervalo_reporte, 3),
+            'p95_s': percentiles(d['latencia_s'].tolist())['p95_s'] if not d.empty else None,
+            'rss_mb_max': round(float(r.max()), 1) if not r.empty else None
+        })
+    rss_total = rss['rss_mb'].dropna() if not rss.empty else pd.Series(dtype=float)
+    resumen['rss_mb_inicial'] = round(float(rss_total.iloc[0]), 1) if not rss_total.empty else None
+    resumen['rss_mb_max'] = round(float(rss_total.max()), 1) if not rss_total.empty else None
+    # Errores de protocolo/conexión y excepciones mostradas por la app, por mensaje
+    errores = pd.concat([df['error'].dropna(), df['excepciones'].explode().dropna()]).value_counts().head(10).to_dict() if not df.empty else {}
+    return resumen, por_accion, serie, errores
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga multi-sesión de la ficha estatal.")
+    parser.add_argument("--app", default="ficha_v2.py", help="Script a servir con streamlit run")
+    parser.add_argument("--url", default=None, help="Servidor ya iniciado (p. ej. ws://localhost:8501); si se omite, se levanta uno")
+    parser.add_argument("--pid", type=int, default=None, help="PID del servidor para medir RSS cuando se usa --url")
+    parser.add_argument("--puerto", type=int, default=8599, help="Puerto del servidor que levanta la prueba")
+    parser.add_argument("--sesiones", type=int, default=10, help="Sesiones concurrentes")
+    parser.add_argument("--duracion", type=float, default=60, help="Duración de la prueba después de la rampa (s)")
+    parser.add_argument("--rampa", type=float, default=10, help="Ventana en la que se abren las sesiones (s)")
+    parser.add_argument("--pensar", type=float, default=2.0, help="Tiempo medio de lectura entre clics (s, exponencial)")
+    parser.add_argument("--prob-vista", type=float, default=0.1, help="Probabilidad de que un clic cambie de vista")
+    parser.add_argument("--trazas", default=None, help="JSONL del diagnóstico cuyas secuencias de estado/vista se reproducen")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="Tiempo máximo de un rerun (s)")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="Periodo de muestreo del RSS (s)")
+    parser.add_argument("--intervalo-reporte", type=float, default=10.0, help="Ancho de cada punto de la serie temporal (s)")
+    parser.add_argument("--salida", default=None, help="Ruta del reporte JSON (por defecto benchmarks/carga_<fecha>.json)")
+    args = parser.parse_args()
+
+    os.chdir(RAIZ)
+    estados = list(leer_state_map(os.path.join(RAIZ, args.app)).values())
+    proceso = None
+    if args.url:
+        url, pid = args.url.rstrip("/"), args.pid
+    else:
+        print(f"🚀 Levantando {args.app} en el puerto {args.puerto}...")
+        proceso = iniciar_servidor(args.app, args.puerto)
+        url, pid = f"ws://localhost:{args.puerto}", proceso.pid
+    try:
+        print(f"⏱️ {args.sesiones} sesiones durante {args.duracion:.0f}s (rampa {args.rampa:.0f}s, lectura media {args.pensar}s)")
+        inicio, registros, muestras = asyncio.run(ejecutar(url, estados, pid, args))
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+
+    resumen, por_accion, serie, errores = resumir(inicio, registros, muestras, args)
+    print(f"\n📊 Latencia de rerun: p50 {resumen['p50_s']}s | p95 {resumen['p95_s']}s | p99 {resumen['p99_s']}s | máx {resumen['max_s']}s")
+    print(f"   {resumen['reruns']} reruns, {resumen['throughput_rps']} reruns/s, {resumen['errores']} errores, {resumen['excepciones_app']} excepciones en la app")
+    if resumen['rss_mb_max'] is not None:
+        print(f"   RSS del servidor: {resumen['rss_mb_inicial']} MB al inicio, {resumen['rss_mb_max']} MB máximo")
+    if por_accion: print("\n" + pd.DataFrame(por_accion).to_string(index=False))
+    print("\n" + pd.DataFrame(serie).to_string(index=False))
+    for error, n in errores.items(): print(f"⚠️ {n}× {error}")
+
+    reporte = {
+        'generado': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit_actual(),
+        'python': platform.python_version(),
+        'streamlit': st.__version__,
+        'app': args.app,
+        'parametros': {k: v for k, v in vars(args).items() if k not in ('salida',)},
+        'resumen': resumen,
+        'por_accion': por_accion,
+        'serie': serie,
+        'errores': errores,
+        'reruns': registros
+    }
+    salida = args.salida or os.path.join("benchmarks", f"carga_{datetime.now():%Y%m%d_%H%M%S}.json")
+    if os.path.dirname(salida): os.makedirs(os.path.dirname(salida), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\n✅ Reporte guardado en: {salida}")
+
+if __name__ == "__main__":
+    main()